@@ -1,11 +1,13 @@
 import os
 import logging
+import sqlite3
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from flask_wtf.csrf import CSRFProtect, CSRFError
-from flask_cors import CORS
-from flask_talisman import Talisman
+from .headers import HeaderMiddleware, csp_nonce
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -14,7 +16,14 @@ logger = logging.getLogger(__name__)
 db = SQLAlchemy()
 migrate = Migrate()
 csrf = CSRFProtect()
-talisman = Talisman()
+
+@event.listens_for(Engine, 'connect')
+def enable_foreign_keys(dbapi_connection, connection_record):
+    """Enforce foreign keys so deletes cascade to tag links and detach subtasks"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
 
 def create_app(test_config=None):
     """Create and configure the Flask application"""
@@ -33,22 +42,57 @@ def create_app(test_config=None):
         SESSION_COOKIE_HTTPONLY=True,
         SESSION_COOKIE_SAMESITE='Lax',
         # CORS settings
-        CORS_METHODS=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
-        CORS_ALLOW_HEADERS=['Content-Type', 'X-CSRF-Token', 'Authorization'],
-        CORS_EXPOSE_HEADERS=['X-CSRF-Token'],
-        CORS_SUPPORTS_CREDENTIALS=True
+        CORS_ORIGIN='*',
+        CORS_METHODS=['GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'],
+        CORS_ALLOW_HEADERS=['Content-Type', 'X-CSRF-Token', 'Authorization', 'If-Match'],
+        CORS_EXPOSE_HEADERS=['X-CSRF-Token', 'ETag'],
+        CORS_MAX_AGE=600,  # Seconds browsers may cache a preflight response
+        # Archival settings
+        ARCHIVE_DATABASE_URI=os.environ.get('ARCHIVE_DATABASE_URL'),
+        ARCHIVE_ENABLED=os.environ.get('ARCHIVE_ENABLED', '').lower() in ('1', 'true', 'yes'),
+        ARCHIVE_AFTER_DAYS=int(os.environ.get('ARCHIVE_AFTER_DAYS', 30)),
+        ARCHIVE_BATCH_SIZE=500,
+        ARCHIVE_INTERVAL=3600,  # Seconds between archive and compaction runs
+        ARCHIVE_VACUUM_PAGES=1000,
+        # Backup settings
+        ADMIN_API_KEY=os.environ.get('ADMIN_API_KEY'),
+        BACKUP_DIR=os.environ.get('BACKUP_DIR', os.path.join(app.instance_path, 'backups')),
+        BACKUP_PAGES_PER_STEP=256,
+        BACKUP_STEP_PAUSE=0.005,  # Seconds writers get between backup steps
+        BACKUP_MAX_RESTARTS=3,  # Restarts caused by concurrent writes before copying in one step
+        HEALTH_CHECK_INTERVAL=10,  # Seconds between background readiness checks
+        # Shared list snapshot (POSIX only), defaults to a file next to the SQLite database
+        SNAPSHOT_ENABLED=os.environ.get('SNAPSHOT_ENABLED', '').lower() in ('1', 'true', 'yes'),
+        SNAPSHOT_PATH=os.environ.get('SNAPSHOT_PATH'),
+        # Coalescing of concurrent identical GETs
+        SINGLEFLIGHT_ENABLED=True,
+        SINGLEFLIGHT_TIMEOUT=5,  # Seconds a waiting request trusts the in-flight one
+        # Sanitized request traces for `flask traffic replay`, disabled when unset
+        TRAFFIC_CAPTURE_PATH=os.environ.get('TRAFFIC_CAPTURE_PATH'),
+        # Due-date reminders, run in a single process to avoid duplicate events
+        REMINDERS_ENABLED=os.environ.get('REMINDERS_ENABLED', '').lower() in ('1', 'true', 'yes'),
+        REMINDER_WINDOW=3600,  # Seconds of upcoming due dates held in memory
+        REMINDER_LEAD=0,  # Seconds before the due date to send the reminder
+        REMINDER_RESYNC=60,  # Seconds between reloads that pick up writes from other workers
+        REMINDER_WEBHOOK_URL=os.environ.get('REMINDER_WEBHOOK_URL'),
+        REMINDER_SINK=None  # Callable receiving each event, e.g. queue.put; overrides the webhook
     )
 
     # Override configuration with test config if provided
     if test_config is not None:
         app.config.update(test_config)
 
+    # Archived todos live in the main database unless a separate file is configured
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    binds.setdefault('archive', app.config['ARCHIVE_DATABASE_URI'] or app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['SQLALCHEMY_BINDS'] = binds
+
     # Initialize extensions
     db.init_app(app)
     migrate.init_app(app, db)
     csrf.init_app(app)
     
-    # Initialize Talisman with security headers
+    # Security and CORS headers are precomputed once and applied at the WSGI layer
     csp = {
         'default-src': "'self'",
         'img-src': "'self' data:",
@@ -56,12 +100,10 @@ def create_app(test_config=None):
         'style-src': "'self' 'unsafe-inline'",
     }
     
-    talisman.init_app(app,
+    app.wsgi_app = HeaderMiddleware(app.wsgi_app, app.config,
+        csp=csp,
+        nonce_in=['script-src', 'style-src'],
         force_https=not app.config.get('TESTING', False),
-        strict_transport_security=True,
-        session_cookie_secure=True,
-        content_security_policy=csp,
-        content_security_policy_nonce_in=['script-src', 'style-src'],
         feature_policy={
             'geolocation': "'none'",
             'midi': "'none'",
@@ -78,6 +120,7 @@ def create_app(test_config=None):
             'payment': "'none'"
         }
     )
+    app.jinja_env.globals['csp_nonce'] = csp_nonce
 
     # Register error handlers
     @app.errorhandler(404)
@@ -100,19 +143,53 @@ def create_app(test_config=None):
     from .routes import bp as api_bp
     app.register_blueprint(api_bp)  # Remove the url_prefix to allow Swagger UI access
 
-    # Enable CORS after registering blueprints
-    CORS(app, resources={
-        r"/*": {
-            "origins": "*",
-            "methods": app.config['CORS_METHODS'],
-            "allow_headers": app.config['CORS_ALLOW_HEADERS'],
-            "expose_headers": app.config['CORS_EXPOSE_HEADERS'],
-            "supports_credentials": app.config['CORS_SUPPORTS_CREDENTIALS']
-        }
-    })
+    # Register CLI commands
+    from .backup import backup_cli
+    from .traffic import traffic_cli
+    app.cli.add_command(backup_cli)
+    app.cli.add_command(traffic_cli)
 
     # Create database tables
+    from .archive import Archiver, enable_incremental_vacuum
     with app.app_context():
+        enable_incremental_vacuum()
         db.create_all()
 
+    # Share one pre-serialized todo list between workers
+    if app.config['SNAPSHOT_ENABLED']:
+        from .snapshot import TodoSnapshot, snapshot_path
+        with app.app_context():
+            path = snapshot_path(app, db.engine)
+        if path:
+            app.extensions['snapshot'] = TodoSnapshot(path)
+            # The database may have changed while no worker was running
+            app.extensions['snapshot'].invalidate()
+
+    # Coalesce concurrent identical reads
+    if app.config['SINGLEFLIGHT_ENABLED']:
+        from .singleflight import SingleFlight
+        app.extensions['singleflight'] = SingleFlight(app.config['SINGLEFLIGHT_TIMEOUT'])
+
+    # Record request traces, leaving health probes out
+    if app.config['TRAFFIC_CAPTURE_PATH']:
+        from .traffic import CaptureMiddleware
+        app.wsgi_app = CaptureMiddleware(app.wsgi_app, app.config['TRAFFIC_CAPTURE_PATH'])
+
+    # Serve cached health probes in front of every other layer
+    from .health import HealthCheck, HealthMiddleware
+    health = app.extensions['health'] = HealthCheck(app)
+    health.refresh()
+    app.wsgi_app = HealthMiddleware(app.wsgi_app, health)
+
+    # Start the background archiver
+    if app.config['ARCHIVE_ENABLED']:
+        app.extensions['archiver'] = Archiver(app)
+        app.extensions['archiver'].start()
+
+    # Start the due-date reminder scheduler
+    if app.config['REMINDERS_ENABLED']:
+        from .reminders import ReminderScheduler, reminder_sink
+        app.extensions['reminders'] = ReminderScheduler(app, reminder_sink(app.config))
+        app.extensions['reminders'].start()
+
     return app 
\ No newline at end of file
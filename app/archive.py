@@ -0,0 +1,165 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, delete, func, tuple_
+from sqlalchemy.sql import text
+from . import db
+from .models import Todo, ArchivedTodo, Tag, todo_tags
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_COLUMNS = (
+    'id', 'title', 'description', 'completed', 'due_date', 'created_at', 'completed_at', 'version', 'parent_id',
+)
+
+
+def archive_batch(cutoff, batch_size):
+    """Move one batch of todos completed before cutoff into the archive.
+
+    The archive may live in a separate SQLite file, so rows are copied and then
+    deleted in two transactions. Only hot rows still at the copied version are
+    deleted, so an edit or reopen between the two commits keeps the todo in
+    the hot table and its archive copy is dropped again. A stale copy of the
+    same todo (same created_at) is replaced, which also makes a batch safe to
+    retry if the process dies between the commits. A copy of a different todo
+    with the same id raises IntegrityError rather than being overwritten.
+    """
+    tag_names = (
+        select(func.json_group_array(Tag.name))
+        .join(todo_tags, todo_tags.c.tag_id == Tag.id)
+        .where(todo_tags.c.todo_id == Todo.id)
+        .scalar_subquery()
+    )
+    rows = db.session.execute(
+        select(*(Todo.__table__.c[name] for name in ARCHIVED_COLUMNS), tag_names.label('tags'))
+        .where(Todo.completed == 1, Todo.completed_at < cutoff)
+        .order_by(Todo.id)
+        .limit(batch_size)
+    ).mappings().all()
+    if not rows:
+        return 0
+
+    ids = [row['id'] for row in rows]
+    archived = {
+        row.id: (row.created_at, row.version)
+        for row in db.session.execute(
+            select(ArchivedTodo.id, ArchivedTodo.created_at, ArchivedTodo.version).where(ArchivedTodo.id.in_(ids))
+        )
+    }
+    stale = [row['id'] for row in rows
+             if row['id'] in archived and archived[row['id']][0] == row['created_at']
+             and archived[row['id']][1] != row['version']]
+    fresh = [dict(row) for row in rows if archived.get(row['id']) != (row['created_at'], row['version'])]
+    if stale:
+        db.session.execute(delete(ArchivedTodo).where(ArchivedTodo.id.in_(stale)))
+    if fresh:
+        db.session.execute(insert(ArchivedTodo), fresh)
+    db.session.commit()
+
+    copied = [(row['id'], row['version']) for row in rows]
+    deleted = set(db.session.execute(
+        delete(Todo)
+        .where(tuple_(Todo.id, Todo.version).in_(copied), Todo.completed == 1, Todo.completed_at < cutoff)
+        .returning(Todo.id)
+    ).scalars())
+    db.session.commit()
+
+    # Rows written between the two commits stay hot; drop the copies made of their old version
+    kept = [(id, version) for id, version in copied if id not in deleted]
+    if kept:
+        db.session.execute(delete(ArchivedTodo).where(tuple_(ArchivedTodo.id, ArchivedTodo.version).in_(kept)))
+        db.session.commit()
+        logger.info(f"Kept {len(kept)} todos changed while being archived")
+    return len(deleted)
+
+
+def archive_completed(older_than, batch_size=500):
+    """Archive all todos completed longer ago than the given timedelta, batch by batch"""
+    cutoff = datetime.utcnow() - older_than
+    total = 0
+    while True:
+        moved = archive_batch(cutoff, batch_size)
+        total += moved
+        if moved < batch_size:
+            break
+    if total:
+        logger.info(f"Archived {total} todos completed before {cutoff.isoformat()}")
+    return total
+
+
+def enable_incremental_vacuum():
+    """Ask SQLite to track free pages so compaction can shrink the file.
+
+    Only takes effect for databases created afterwards or after a full VACUUM;
+    deploy.py runs that VACUUM once for existing files.
+    """
+    for engine in {db.engine, db.engines['archive']}:
+        if engine.dialect.name == 'sqlite':
+            with engine.begin() as conn:
+                conn.execute(text('PRAGMA auto_vacuum = INCREMENTAL'))
+
+
+def compact(vacuum_pages=None):
+    """Return freed pages to the filesystem and refresh query planner statistics"""
+    for engine in {db.engine, db.engines['archive']}:
+        if engine.dialect.name != 'sqlite':
+            continue
+        conn = engine.raw_connection()
+        try:
+            # executescript steps the pragma to completion; execute would free a single page
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+                pages = f'({int(vacuum_pages)})' if vacuum_pages else ''
+                conn.driver_connection.executescript(f'PRAGMA incremental_vacuum{pages};')
+            conn.execute('PRAGMA optimize')
+        finally:
+            conn.close()
+
+
+def get_archived(id):
+    """Look up an archived todo by id"""
+    return db.session.get(ArchivedTodo, id)
+
+
+def list_archived():
+    """Return all archived todos"""
+    return ArchivedTodo.query.order_by(ArchivedTodo.id).all()
+
+
+class Archiver:
+    """Background thread that periodically archives completed todos and compacts the database"""
+
+    def __init__(self, app):
+        self.app = app
+        self.interval = app.config['ARCHIVE_INTERVAL']
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        with self.app.app_context():
+            try:
+                archive_completed(
+                    timedelta(days=self.app.config['ARCHIVE_AFTER_DAYS']),
+                    self.app.config['ARCHIVE_BATCH_SIZE'],
+                )
+                compact(self.app.config['ARCHIVE_VACUUM_PAGES'])
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error archiving todos: {str(e)}", exc_info=True)
+            finally:
+                db.session.remove()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='todo-archiver', daemon=True)
+            self._thread.start()
+            logger.info(f"Started todo archiver with a {self.interval}s interval")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,223 @@
+import os
+import gzip
+import shutil
+import sqlite3
+import logging
+import tempfile
+import time
+from contextlib import contextmanager, ExitStack
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from . import db
+
+logger = logging.getLogger(__name__)
+
+backup_cli = AppGroup('backup', help='Online backup and restore of the todo database.')
+
+
+class _BackupRestarted(Exception):
+    """Raised from the progress callback to abandon a stepped backup"""
+
+
+def _sqlite_connection(engine):
+    """Check out the raw sqlite3 connection behind an engine"""
+    if engine.dialect.name != 'sqlite':
+        raise RuntimeError(f"Online backup requires SQLite, not {engine.dialect.name}")
+    return engine.raw_connection()
+
+
+def archive_engine():
+    """Return the archive engine when ARCHIVE_DATABASE_URL puts it in a separate file, else None"""
+    archive = db.engines['archive']
+    if archive.url.database == db.engine.url.database:
+        return None
+    return archive
+
+
+def archive_backup_path(path):
+    """Name the archive database backup that accompanies a main backup"""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f'archive-{name}')
+
+
+def _backup_engine(engine, dest_path, pages, step_pause, compress):
+    config = current_app.config
+    dest_dir = os.path.dirname(os.path.abspath(dest_path))
+    os.makedirs(dest_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dest_dir, suffix='.tmp')
+    os.close(fd)
+
+    steps = 0
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal steps, restarts, last_remaining
+        steps += 1
+        # A write from another connection makes SQLite start the copy over
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts >= config['BACKUP_MAX_RESTARTS']:
+                raise _BackupRestarted()
+        last_remaining = remaining
+        if remaining and step_pause:
+            time.sleep(step_pause)
+
+    started = time.perf_counter()
+    source = _sqlite_connection(engine)
+    try:
+        target = sqlite3.connect(tmp_path)
+        try:
+            try:
+                source.driver_connection.backup(target, pages=pages, progress=progress)
+            except _BackupRestarted:
+                # Under steady write traffic a stepped copy never converges, so
+                # finish with one step that holds the read lock for the whole copy
+                logger.info(f"Backup restarted {restarts} times, finishing in a single step")
+                source.driver_connection.backup(target, pages=-1)
+                steps += 1
+        finally:
+            target.close()
+
+        size = os.path.getsize(tmp_path)
+        if compress:
+            gz_path = tmp_path + '.gz'
+            with open(tmp_path, 'rb') as raw, gzip.open(gz_path, 'wb', compresslevel=6) as packed:
+                shutil.copyfileobj(raw, packed)
+            os.remove(tmp_path)
+            tmp_path = gz_path
+        os.replace(tmp_path, dest_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        source.close()
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Backed up database to {dest_path} ({size} bytes in {steps} steps, {elapsed:.3f}s)")
+    return {
+        'path': dest_path,
+        'bytes': size,
+        'stored_bytes': os.path.getsize(dest_path),
+        'steps': steps,
+        'restarts': restarts,
+        'seconds': round(elapsed, 4),
+    }
+
+
+def backup_database(dest_path, pages=None, step_pause=None, compress=False, engine=None):
+    """Copy the live database to dest_path with the SQLite online backup API.
+
+    The copy runs ``pages`` pages at a time and pauses between steps, so the
+    source is only read-locked for one short step and writers are never stalled
+    for the whole copy. Writes from other connections make SQLite restart the
+    copy, so after BACKUP_MAX_RESTARTS restarts the rest is copied in one step.
+    The result is written to a temporary file and renamed into place, so
+    dest_path is never a torn copy.
+
+    When the archive lives in a separate file it is backed up next to dest_path
+    (see archive_backup_path), after the main database: a todo archived between
+    the two copies then appears in both rather than in neither. Returns timing
+    statistics, with the archive's under ``archive``.
+    """
+    config = current_app.config
+    pages = pages or config['BACKUP_PAGES_PER_STEP']
+    step_pause = config['BACKUP_STEP_PAUSE'] if step_pause is None else step_pause
+
+    stats = _backup_engine(engine or db.engine, dest_path, pages, step_pause, compress)
+    archive = archive_engine() if engine is None else None
+    stats['archive'] = None
+    if archive is not None:
+        stats['archive'] = _backup_engine(archive, archive_backup_path(dest_path), pages, step_pause, compress)
+    return stats
+
+
+@contextmanager
+def _open_backup(src_path):
+    """Open a possibly gzipped backup and check its integrity"""
+    tmp_path = None
+    if src_path.endswith('.gz'):
+        fd, tmp_path = tempfile.mkstemp(suffix='.db')
+        with os.fdopen(fd, 'wb') as raw, gzip.open(src_path, 'rb') as packed:
+            shutil.copyfileobj(packed, raw)
+    try:
+        source = sqlite3.connect(tmp_path or src_path)
+        try:
+            result = source.execute('PRAGMA integrity_check').fetchone()[0]
+            if result != 'ok':
+                raise ValueError(f"Backup {src_path} failed integrity check: {result}")
+            yield source
+        finally:
+            source.close()
+    finally:
+        if tmp_path:
+            os.remove(tmp_path)
+
+
+def _restore_engine(source, engine):
+    target = _sqlite_connection(engine)
+    try:
+        source.backup(target.driver_connection, pages=-1)
+    finally:
+        target.close()
+
+
+def restore_database(src_path, engine=None):
+    """Replace the live database with a backup taken by backup_database.
+
+    The backup is integrity-checked first and then copied into the live
+    database in a single backup step. SQLite applies that as one transaction,
+    so other connections see either the old or the restored database. A
+    separate archive file is restored from its companion backup as well; both
+    backups are checked before either database is touched.
+    """
+    archive = archive_engine() if engine is None else None
+    archive_src = archive_backup_path(src_path) if archive is not None else None
+    if archive_src is not None and not os.path.exists(archive_src):
+        raise FileNotFoundError(
+            f"Backup {src_path} has no archive backup {archive_src}; "
+            f"the archive is a separate database and must be restored with it")
+
+    with ExitStack() as stack:
+        source = stack.enter_context(_open_backup(src_path))
+        archive_source = stack.enter_context(_open_backup(archive_src)) if archive_src else None
+
+        db.session.remove()
+        _restore_engine(source, engine or db.engine)
+        if archive_source is not None:
+            _restore_engine(archive_source, archive)
+
+    snapshot = current_app.extensions.get('snapshot')
+    if snapshot is not None:
+        snapshot.invalidate()
+
+    logger.info(f"Restored database from {src_path}" + (f" and archive from {archive_src}" if archive_src else ''))
+
+
+def default_backup_path(compress=False):
+    """Build a timestamped file name inside BACKUP_DIR"""
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+    suffix = '.db.gz' if compress else '.db'
+    return os.path.join(current_app.config['BACKUP_DIR'], f'todos-{stamp}{suffix}')
+
+
+@backup_cli.command('create')
+@click.argument('dest', required=False)
+@click.option('--compress', is_flag=True, help='Gzip the backup file.')
+@click.option('--pages', type=int, help='Pages copied per backup step.')
+def create_command(dest, compress, pages):
+    """Take an online backup of the database."""
+    stats = backup_database(dest or default_backup_path(compress), pages=pages, compress=compress)
+    for written in filter(None, (stats, stats['archive'])):
+        click.echo(f"Wrote {written['path']} ({written['stored_bytes']} bytes, {written['seconds']}s)")
+
+
+@backup_cli.command('restore')
+@click.argument('src')
+def restore_command(src):
+    """Restore the database from a backup file."""
+    restore_database(src)
+    click.echo(f"Restored database from {src}")
@@ -0,0 +1,92 @@
+import secrets
+from flask import request
+from werkzeug.wsgi import get_current_url
+
+NONCE_ENVIRON_KEY = 'todo_api.csp_nonce'
+
+
+def csp_nonce():
+    """Return the CSP nonce for the current request, creating it on first use.
+
+    Templates call this when they emit inline scripts or styles. Only responses
+    that asked for a nonce get one merged into their Content-Security-Policy.
+    """
+    nonce = request.environ.get(NONCE_ENVIRON_KEY)
+    if nonce is None:
+        nonce = request.environ[NONCE_ENVIRON_KEY] = secrets.token_urlsafe(24)
+    return nonce
+
+
+def format_policy(policy):
+    return '; '.join(f'{directive} {value}' for directive, value in policy.items())
+
+
+class HeaderMiddleware:
+    """Apply the security and CORS headers for every response at the WSGI layer.
+
+    The header set is computed once at startup. Preflight OPTIONS requests are
+    answered here without entering Flask routing, and plain HTTP is redirected
+    to HTTPS when force_https is set.
+    """
+
+    def __init__(self, wsgi_app, config, csp, feature_policy, nonce_in=(), force_https=True):
+        self.wsgi_app = wsgi_app
+        self.csp = csp
+        self.nonce_in = tuple(nonce_in)
+        self.force_https = force_https
+
+        cors_headers = [
+            ('Access-Control-Allow-Origin', config['CORS_ORIGIN']),
+            ('Access-Control-Allow-Methods', ', '.join(config['CORS_METHODS'])),
+            ('Access-Control-Allow-Headers', ', '.join(config['CORS_ALLOW_HEADERS'])),
+            ('Access-Control-Expose-Headers', ', '.join(config['CORS_EXPOSE_HEADERS'])),
+        ]
+        security_headers = [
+            ('X-Content-Type-Options', 'nosniff'),
+            ('X-Frame-Options', 'SAMEORIGIN'),
+            ('X-XSS-Protection', '1; mode=block'),
+            ('Referrer-Policy', 'strict-origin-when-cross-origin'),
+            ('Feature-Policy', format_policy(feature_policy)),
+            ('Permissions-Policy', 'browsing-topics=()'),
+            ('Content-Security-Policy', format_policy(csp)),
+        ]
+        hsts = ('Strict-Transport-Security', 'max-age=31556926; includeSubDomains')
+
+        self.headers = cors_headers + security_headers
+        self.secure_headers = self.headers + [hsts]
+        self.preflight_headers = cors_headers + [
+            ('Access-Control-Max-Age', str(config['CORS_MAX_AGE'])),
+            ('Content-Length', '0'),
+        ]
+        self.secure_preflight_headers = self.preflight_headers + [hsts]
+        self.names = {name.lower() for name, _ in self.secure_headers}
+
+    def nonce_policy(self, nonce):
+        policy = dict(self.csp)
+        for directive in self.nonce_in:
+            policy[directive] = f"{policy.get(directive, '')} 'nonce-{nonce}'".strip()
+        return format_policy(policy)
+
+    def __call__(self, environ, start_response):
+        secure = (environ.get('wsgi.url_scheme') == 'https'
+                  or environ.get('HTTP_X_FORWARDED_PROTO') == 'https')
+
+        if self.force_https and not secure:
+            location = get_current_url(environ).replace('http://', 'https://', 1)
+            start_response('302 FOUND', [('Location', location), ('Content-Length', '0')])
+            return [b'']
+
+        if environ['REQUEST_METHOD'] == 'OPTIONS':
+            start_response('200 OK', self.secure_preflight_headers if secure else self.preflight_headers)
+            return [b'']
+
+        def header_start_response(status, headers, exc_info=None):
+            extra = self.secure_headers if secure else self.headers
+            headers = [h for h in headers if h[0].lower() not in self.names] + extra
+            nonce = environ.get(NONCE_ENVIRON_KEY)
+            if nonce is not None:
+                headers = [h for h in headers if h[0] != 'Content-Security-Policy']
+                headers.append(('Content-Security-Policy', self.nonce_policy(nonce)))
+            return start_response(status, headers, exc_info)
+
+        return self.wsgi_app(environ, header_start_response)
@@ -0,0 +1,109 @@
+import json
+import time
+import logging
+import threading
+from sqlalchemy import inspect
+from sqlalchemy.sql import text
+from . import db
+from .models import Todo
+
+logger = logging.getLogger(__name__)
+
+
+def missing_columns(conn):
+    """Return the model columns that are absent from the todo table"""
+    inspector = inspect(conn)
+    if not inspector.has_table(Todo.__tablename__):
+        return {column.name for column in Todo.__table__.columns}
+    present = {column['name'] for column in inspector.get_columns(Todo.__tablename__)}
+    return {column.name for column in Todo.__table__.columns} - present
+
+
+class HealthCheck:
+    """Cached database readiness, refreshed by a background thread.
+
+    Probes only read the cached response, so they never touch the database.
+    The schema is verified until it passes once; after that each refresh is a
+    plain SELECT 1.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.interval = app.config['HEALTH_CHECK_INTERVAL']
+        self.schema_ok = False
+        self.checked_at = None
+        self.response = (503, b'{"status": "starting"}')
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        error = None
+        with self.app.app_context():
+            try:
+                with db.engine.connect() as conn:
+                    conn.execute(text('SELECT 1'))
+                    if not self.schema_ok:
+                        missing = missing_columns(conn)
+                        if missing:
+                            raise RuntimeError(f"Missing columns in todo table: {sorted(missing)}")
+                        self.schema_ok = True
+            except Exception as e:
+                error = str(e)
+                logger.warning(f"Readiness check failed: {error}")
+
+        self.checked_at = time.monotonic()
+        if error is None:
+            self.response = (200, json.dumps({'status': 'ready'}).encode())
+        else:
+            self.response = (503, json.dumps({'status': 'unavailable', 'error': error}).encode())
+
+    def current(self):
+        """Return the cached (status, body), treating a stalled refresher as unavailable"""
+        if self._thread is not None and time.monotonic() - self.checked_at > 3 * self.interval:
+            return 503, b'{"status": "stale"}'
+        return self.response
+
+    def _run(self):
+        while True:
+            self.refresh()
+            if self._stop.wait(self.interval):
+                break
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='todo-health', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class HealthMiddleware:
+    """Answer /healthz and /readyz before HTTPS redirects, headers or Flask routing"""
+
+    HEADERS = [('Content-Type', 'application/json'), ('Cache-Control', 'no-store')]
+    REASONS = {200: '200 OK', 503: '503 SERVICE UNAVAILABLE'}
+
+    def __init__(self, wsgi_app, health):
+        self.wsgi_app = wsgi_app
+        self.health = health
+
+    def respond(self, start_response, status, body):
+        start_response(self.REASONS[status], self.HEADERS + [('Content-Length', str(len(body)))])
+        return [body]
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO')
+        if path == '/healthz':
+            return self.respond(start_response, 200, b'{"status": "ok"}')
+        if path == '/readyz':
+            self.health.start()
+            return self.respond(start_response, *self.health.current())
+        return self.wsgi_app(environ, start_response)
@@ -1,8 +1,26 @@
+import json
 from datetime import datetime
 from . import db
-from sqlalchemy import CheckConstraint
+from sqlalchemy import CheckConstraint, Index
+from sqlalchemy.orm import validates
 from sqlalchemy.sql import text
 
+# Association table for the many-to-many link between todos and tags
+todo_tags = db.Table('todo_tag',
+    db.Column('todo_id', db.Integer, db.ForeignKey('todo.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id', ondelete='CASCADE'), primary_key=True),
+    Index('ix_todo_tag_tag_id', 'tag_id'),
+)
+
+class Tag(db.Model):
+    __tablename__ = 'tag'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False, unique=True)
+
+    def __repr__(self):
+        return f'<Tag {self.name}>'
+
 class Todo(db.Model):
     __tablename__ = 'todo'  # Explicitly set the table name
     
@@ -12,12 +30,32 @@ class Todo(db.Model):
     completed = db.Column(db.Integer, default=0, nullable=False)
     due_date = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, nullable=False, server_default=text('CURRENT_TIMESTAMP'))
+    version = db.Column(db.Integer, default=1, nullable=False, server_default=text('1'))
+    parent_id = db.Column(db.Integer, db.ForeignKey('todo.id', ondelete='SET NULL'), nullable=True, index=True)
+    completed_at = db.Column(db.DateTime, nullable=True)  # Archive age is measured from here
+
+    # Collections load in one batched IN query per relationship, never per row
+    tags = db.relationship('Tag', secondary=todo_tags, lazy='selectin', order_by='Tag.name')
+    subtasks = db.relationship('Todo', lazy='selectin', join_depth=1, order_by='Todo.id')
     
     # Add check constraint to ensure completed is only 0 or 1
+    # AUTOINCREMENT keeps SQLite from reusing the ids of archived rows
     __table_args__ = (
         CheckConstraint('completed IN (0, 1)', name='check_completed_boolean'),
+        Index('ix_todo_completed_completed_at', 'completed', 'completed_at'),
+        Index('ix_todo_completed_due_date', 'completed', 'due_date'),  # Due-soon range scans
+        {'sqlite_autoincrement': True},
     )
     
+    @validates('completed')
+    def track_completion(self, key, completed):
+        """Record when a todo is completed, keeping the first completion time"""
+        if not completed:
+            self.completed_at = None
+        elif self.completed_at is None:
+            self.completed_at = datetime.utcnow()
+        return completed
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -25,7 +63,15 @@ class Todo(db.Model):
             'description': self.description,
             'completed': bool(self.completed),  # Convert Integer to Boolean
             'due_date': self.due_date.isoformat() if self.due_date else None,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'version': self.version,
+            'archived': False,
+            'tags': [tag.name for tag in self.tags],
+            'parent_id': self.parent_id,
+            'subtasks': [
+                {'id': subtask.id, 'title': subtask.title, 'completed': bool(subtask.completed)}
+                for subtask in self.subtasks
+            ]
         }
     
     @classmethod
@@ -38,4 +84,40 @@ class Todo(db.Model):
         )
     
     def __repr__(self):
-        return f'<Todo {self.id}: {self.title}>' 
\ No newline at end of file
+        return f'<Todo {self.id}: {self.title}>' 
+
+
+class ArchivedTodo(db.Model):
+    """Completed todos moved out of the hot table by the archiver"""
+    __tablename__ = 'todo_archive'
+    __bind_key__ = 'archive'  # Defaults to the main database, may point at a separate file
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    title = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.String(500), nullable=True)
+    completed = db.Column(db.Integer, default=1, nullable=False)
+    due_date = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=True)
+    version = db.Column(db.Integer, default=1, nullable=False)
+    parent_id = db.Column(db.Integer, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    tags = db.Column(db.Text, nullable=False, default='[]')  # JSON array of tag names
+    archived_at = db.Column(db.DateTime, nullable=False, server_default=text('CURRENT_TIMESTAMP'))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'description': self.description,
+            'completed': bool(self.completed),
+            'due_date': self.due_date.isoformat() if self.due_date else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'version': self.version,
+            'archived': True,
+            'tags': json.loads(self.tags),
+            'parent_id': self.parent_id,
+            'subtasks': []
+        }
+
+    def __repr__(self):
+        return f'<ArchivedTodo {self.id}: {self.title}>'
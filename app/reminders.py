@@ -0,0 +1,211 @@
+import re
+import json
+import heapq
+import time
+import logging
+import threading
+import urllib.request
+from datetime import datetime, timedelta
+from . import db
+from .models import Todo
+
+logger = logging.getLogger(__name__)
+
+WINDOW_PATTERN = re.compile(r'^(\d+)([smhdw]?)$')
+WINDOW_UNITS = {'': 'seconds', 's': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+MAX_WINDOW = timedelta(days=366)
+
+
+def parse_window(value):
+    """Parse a duration such as ``90``, ``30m``, ``1h`` or ``2d``"""
+    match = WINDOW_PATTERN.match(value.strip().lower())
+    if not match:
+        raise ValueError(f"Invalid window '{value}', expected a number with an optional s, m, h, d or w unit")
+    window = timedelta(**{WINDOW_UNITS[match.group(2)]: int(match.group(1))})
+    if window > MAX_WINDOW:
+        raise ValueError(f"Window must be at most {MAX_WINDOW.days} days")
+    return window
+
+
+def due_soon(within, include_overdue=True, now=None):
+    """Incomplete todos due before now + within, earliest first.
+
+    Both bounds are a range scan on ix_todo_completed_due_date, so the cost
+    follows the number of due todos rather than the size of the table.
+    """
+    now = now or datetime.utcnow()
+    query = Todo.query.filter(Todo.completed == 0, Todo.due_date <= now + within)
+    if not include_overdue:
+        query = query.filter(Todo.due_date >= now)
+    return query.order_by(Todo.due_date, Todo.id).all()
+
+
+def log_sink(event):
+    logger.info(f"Todo {event['id']} is due at {event['due_date']}: {event['title']}")
+
+
+def webhook_sink(url, timeout=5):
+    """Return a sink that POSTs each event as JSON to url"""
+    def send(event):
+        request = urllib.request.Request(url, data=json.dumps(event).encode(), method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+    return send
+
+
+def reminder_sink(config):
+    """Pick the configured sink: REMINDER_SINK, a webhook, or the log"""
+    if config.get('REMINDER_SINK') is not None:
+        return config['REMINDER_SINK']
+    if config.get('REMINDER_WEBHOOK_URL'):
+        return webhook_sink(config['REMINDER_WEBHOOK_URL'])
+    return log_sink
+
+
+class ReminderScheduler:
+    """Emit an event to a sink when an incomplete todo becomes due.
+
+    Only todos due within the next REMINDER_WINDOW seconds are held, in a heap
+    ordered by fire time (due date minus REMINDER_LEAD). The window is reloaded
+    every REMINDER_RESYNC seconds to pick up writes from other workers, and API
+    writes reschedule their todo immediately. Each todo is rechecked against
+    the database before its event fires.
+    """
+
+    def __init__(self, app, sink):
+        self.app = app
+        self.sink = sink
+        self.window = timedelta(seconds=app.config['REMINDER_WINDOW'])
+        self.lead = timedelta(seconds=app.config['REMINDER_LEAD'])
+        self.resync = app.config['REMINDER_RESYNC']
+        self.horizon = None  # Due dates up to here are loaded
+        self._heap = []  # (fire_at, id, due_date), stale entries are skipped when popped
+        self._due = {}  # id -> due_date currently scheduled
+        self._fired = {}  # id -> due_date already reminded about
+        self._loaded_at = None
+        self._loaded_until = None  # Time of the previous load, the lower bound of the next one
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    def _push(self, id, due_date):
+        self._due[id] = due_date
+        heapq.heappush(self._heap, (due_date - self.lead, id, due_date))
+
+    def load(self, now=None):
+        """Replace the schedule with the todos due since the previous load and in the next window"""
+        now = now or datetime.utcnow()
+        horizon = now + self.window
+        # Todos written elsewhere that fell due since the last load are still reminded, at once
+        since = self._loaded_until or now
+        with self.app.app_context():
+            try:
+                rows = db.session.query(Todo.id, Todo.due_date).filter(
+                    Todo.completed == 0, Todo.due_date > since, Todo.due_date <= horizon).all()
+            finally:
+                db.session.remove()
+
+        with self._cond:
+            self._fired = {id: due for id, due in self._fired.items() if due > since}
+            self._due = {id: due for id, due in rows if self._fired.get(id) != due}
+            self._heap = [(due - self.lead, id, due) for id, due in self._due.items()]
+            heapq.heapify(self._heap)
+            self.horizon = horizon
+            self._loaded_until = now
+            self._loaded_at = time.monotonic()
+            self._cond.notify()
+        return len(self._due)
+
+    def update(self, id, due_date, completed):
+        """React to a todo being created or changed"""
+        with self._cond:
+            if self.horizon is None:
+                return
+            if completed or due_date is None or due_date <= datetime.utcnow() or due_date > self.horizon:
+                self._due.pop(id, None)
+            elif self._due.get(id) != due_date and self._fired.get(id) != due_date:
+                self._push(id, due_date)
+                self._cond.notify()
+
+    def remove(self, id):
+        """React to a todo being deleted"""
+        with self._cond:
+            self._due.pop(id, None)
+
+    def pending(self):
+        with self._cond:
+            return dict(self._due)
+
+    def _pop_due(self, now):
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                _, id, due_date = heapq.heappop(self._heap)
+                if self._due.get(id) == due_date:
+                    del self._due[id]
+                    self._fired[id] = due_date
+                    due.append((id, due_date))
+        return due
+
+    def _emit(self, due, now):
+        with self.app.app_context():
+            try:
+                todos = {todo.id: todo for todo in Todo.query.filter(Todo.id.in_([id for id, _ in due]))}
+                for id, due_date in due:
+                    todo = todos.get(id)
+                    # The row may have changed in another worker since it was scheduled
+                    if todo is None or todo.completed or todo.due_date != due_date:
+                        continue
+                    event = {
+                        'event': 'todo.due',
+                        'id': todo.id,
+                        'title': todo.title,
+                        'due_date': todo.due_date.isoformat(),
+                        'reminded_at': now.isoformat(),
+                    }
+                    try:
+                        self.sink(event)
+                    except Exception as e:
+                        logger.error(f"Error sending reminder for todo {id}: {str(e)}", exc_info=True)
+            finally:
+                db.session.remove()
+
+    def run_once(self, now=None):
+        """Reload the window when due and emit every reminder whose time has come"""
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.resync:
+            self.load(now)
+        now = now or datetime.utcnow()
+        due = self._pop_due(now)
+        if due:
+            self._emit(due, now)
+        return len(due)
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Error running reminders: {str(e)}", exc_info=True)
+            with self._cond:
+                timeout = self.resync - (time.monotonic() - (self._loaded_at or 0))
+                if self._heap:
+                    timeout = min(timeout, (self._heap[0][0] - datetime.utcnow()).total_seconds())
+                if not self._stopped:
+                    self._cond.wait(max(timeout, 0))
+                if self._stopped:
+                    break
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='todo-reminders', daemon=True)
+            self._thread.start()
+            logger.info(f"Started reminder scheduler with a {self.window.total_seconds():.0f}s window")
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -1,20 +1,23 @@
+import hmac
 import logging
+import os
 from flask import Blueprint, jsonify, request, make_response, current_app, Response
-from flask_restx import Api, Resource, fields
+from flask_restx import Api, Resource, fields, marshal
 from flask_wtf.csrf import CSRFProtect, generate_csrf
-from flask_cors import CORS
-from flask_talisman import Talisman
 from werkzeug.wrappers import Response as WrapperResponse
-from werkzeug.exceptions import NotFound, BadRequest
+from werkzeug.exceptions import NotFound, BadRequest, PreconditionFailed, Forbidden
 from http import HTTPStatus
-from .models import Todo, db
+from .models import Todo, Tag, db
+from .archive import get_archived, list_archived
+from .backup import backup_database, default_backup_path
+from .reminders import parse_window, due_soon
+from sqlalchemy import update, delete, insert, func
 from datetime import datetime
 from functools import wraps
 
 logger = logging.getLogger(__name__)
 bp = Blueprint('todos', __name__)
 csrf = CSRFProtect()
-talisman = Talisman()
 
 # Initialize Flask-RESTX with Swagger UI
 api = Api(bp,
@@ -34,34 +37,49 @@ api = Api(bp,
 # Exempt all Blueprint routes from CSRF protection
 csrf.exempt(bp)
 
-# Enable CORS for the API
-CORS(bp, resources={
-    r"/*": {
-        "origins": "*",
-        "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "X-CSRF-Token", "Authorization"],
-        "expose_headers": ["X-CSRF-Token"]
-    }
-})
-
 # Define the namespace for todos
 ns = api.namespace('todos', description='Todo operations')
 
+admin_ns = api.namespace('admin', description='Administrative operations')
+
 # Define models for swagger documentation
+subtask_model = api.model('Subtask', {
+    'id': fields.Integer(readonly=True, description='The subtask identifier'),
+    'title': fields.String(readonly=True, description='The subtask title'),
+    'completed': fields.Boolean(readonly=True, description='The subtask completion status')
+})
+
 todo_model = api.model('Todo', {
     'id': fields.Integer(readonly=True, description='The todo unique identifier'),
     'title': fields.String(required=True, description='The todo title'),
     'description': fields.String(description='The todo description'),
     'completed': fields.Boolean(description='The todo completion status'),
     'due_date': fields.DateTime(description='The todo due date'),
-    'created_at': fields.DateTime(readonly=True, description='The creation date')
+    'created_at': fields.DateTime(readonly=True, description='The creation date'),
+    'version': fields.Integer(readonly=True, description='The todo row version, echoed as the ETag'),
+    'archived': fields.Boolean(readonly=True, description='Whether the todo was moved to the archive'),
+    'tags': fields.List(fields.String, description='The todo tag names'),
+    'parent_id': fields.Integer(description='The parent todo of a subtask'),
+    'subtasks': fields.List(fields.Nested(subtask_model), readonly=True, description='The todo subtasks')
+})
+
+backup_model = api.model('Backup', {
+    'path': fields.String(description='The backup file name inside BACKUP_DIR'),
+    'bytes': fields.Integer(description='The database size'),
+    'stored_bytes': fields.Integer(description='The backup file size after optional compression'),
+    'steps': fields.Integer(description='The number of backup steps taken'),
+    'restarts': fields.Integer(description='The number of times concurrent writes restarted the copy'),
+    'seconds': fields.Float(description='The wall-clock duration of the backup'),
+    'archive_path': fields.String(description='The archive backup file name, when the archive is a separate database')
 })
 
 todo_input = api.model('TodoInput', {
     'title': fields.String(required=True, description='The todo title'),
     'description': fields.String(description='The todo description'),
     'completed': fields.Boolean(description='The todo completion status'),
-    'due_date': fields.DateTime(description='The todo due date')
+    'due_date': fields.DateTime(description='The todo due date'),
+    'tags': fields.List(fields.String, description='The todo tag names, replacing any existing tags'),
+    'parent_id': fields.Integer(description='Make this todo a subtask of another todo')
 })
 
 @bp.errorhandler(404)
@@ -90,43 +108,150 @@ def add_csrf_token(response):
     response.headers['X-CSRF-Token'] = token
     return response
 
-def add_cors_headers(response):
-    """Add CORS headers to response"""
-    if not isinstance(response, (Response, WrapperResponse)):
-        response = make_response(response)
-    response.headers['Access-Control-Allow-Origin'] = '*'
-    response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
-    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, X-CSRF-Token, Authorization'
-    response.headers['Access-Control-Expose-Headers'] = 'X-CSRF-Token'
+def to_response(response):
+    """Turn a view return value into a response object"""
+    if isinstance(response, tuple):
+        return make_response(jsonify(response[0]), *response[1:])
+    elif not isinstance(response, (Response, WrapperResponse)):
+        return make_response(jsonify(response))
     return response
 
+def coalesce_reads(f):
+    """Share one execution between concurrent identical GET requests"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        flight = current_app.extensions.get('singleflight')
+        if request.method != 'GET' or flight is None:
+            return f(*args, **kwargs)
+
+        def compute():
+            response = to_response(f(*args, **kwargs))
+            headers = [(k, v) for k, v in response.headers if k not in ('Content-Length', 'Set-Cookie')]
+            return response.get_data(), response.status_code, headers
+
+        key = (request.path, tuple(sorted(request.args.items(multi=True))))
+        body, status, headers = flight.do(key, compute)
+        return current_app.response_class(body, status=status, headers=headers)
+    return decorated_function
+
 def add_response_headers(f):
+    """Build a response and attach the CSRF token; CORS and security headers come from HeaderMiddleware"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if request.method == 'OPTIONS':
-            response = make_response()
-            response.status_code = HTTPStatus.OK
-            response = add_cors_headers(response)
-            return response
-
-        response = f(*args, **kwargs)
-        if isinstance(response, tuple):
-            response = make_response(jsonify(response[0]), response[1])
-        elif not isinstance(response, (Response, WrapperResponse)):
-            response = make_response(jsonify(response))
+        response = to_response(f(*args, **kwargs))
         
-        # Add CSRF token and CORS headers
+        # Add CSRF token
         response = add_csrf_token(response)
-        response = add_cors_headers(response)
-        
-        # Add security headers
-        response.headers['X-Content-Type-Options'] = 'nosniff'
-        response.headers['X-Frame-Options'] = 'SAMEORIGIN'
-        response.headers['X-XSS-Protection'] = '1; mode=block'
         
         return response
     return decorated_function
 
+def todo_etag(version):
+    """Build the strong ETag advertised for a todo row version"""
+    return f'"{version}"'
+
+def if_match_versions():
+    """Return the row versions listed in If-Match, or None when no version check applies"""
+    if_match = request.if_match
+    if not if_match or if_match.star_tag:
+        return None
+    versions = []
+    for etag in if_match.as_set():
+        try:
+            versions.append(int(etag))
+        except ValueError:
+            continue
+    return versions
+
+def update_values(data):
+    """Translate a partial todo payload into column values for a single UPDATE"""
+    values = {}
+    if 'title' in data:
+        values['title'] = data['title']
+    if 'description' in data:
+        values['description'] = data['description']
+    if 'due_date' in data:
+        values['due_date'] = datetime.fromisoformat(data['due_date']) if data['due_date'] else None
+    if 'completed' in data:
+        values['completed'] = 1 if data['completed'] else 0
+        # Keep the first completion time, matching Todo.track_completion
+        values['completed_at'] = func.coalesce(Todo.completed_at, datetime.utcnow()) if data['completed'] else None
+    if 'parent_id' in data:
+        values['parent_id'] = data['parent_id']
+    return values
+
+def resolve_tags(names):
+    """Return Tag rows for the given names, creating any missing ones in one statement"""
+    if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+        raise BadRequest("Tags must be a list of strings")
+    names = sorted({name.strip() for name in names if name.strip()})
+    if any(len(name) > 50 for name in names):
+        raise BadRequest("Tag names must be at most 50 characters")
+    if not names:
+        return []
+    db.session.execute(insert(Tag).prefix_with('OR IGNORE'), [{'name': name} for name in names])
+    return Tag.query.filter(Tag.name.in_(names)).order_by(Tag.name).all()
+
+def check_parent(id, parent_id):
+    """Reject parents that do not exist or would make a todo its own ancestor"""
+    if parent_id is None:
+        return
+    if not isinstance(parent_id, int) or isinstance(parent_id, bool):
+        raise BadRequest("parent_id must be an integer")
+    current = parent_id
+    while current is not None:
+        if current == id:
+            raise BadRequest("A todo cannot be its own ancestor")
+        row = db.session.query(Todo.parent_id).filter_by(id=current).first()
+        if row is None:
+            raise BadRequest(f"Parent todo {parent_id} does not exist")
+        current = row[0]
+
+def get_snapshot():
+    """Return the shared list snapshot, rebuilding it if a write invalidated it.
+
+    Returns None when the rebuild fails, so the read is served from the database.
+    """
+    snapshot = current_app.extensions.get('snapshot')
+    if snapshot is not None and not snapshot.has_snapshot():
+        try:
+            snapshot.publish(build_snapshot, only_if_missing=True)
+        except Exception as e:
+            logger.error(f"Error rebuilding todo snapshot: {str(e)}", exc_info=True)
+            return None
+    return snapshot
+
+def build_snapshot():
+    """Serialize every todo exactly as the list endpoint would"""
+    return [
+        (todo.id, todo.version, current_app.json.dumps(marshal(todo.to_dict(), todo_model)).encode())
+        for todo in Todo.query.order_by(Todo.id)
+    ]
+
+def after_write(id, todo=None):
+    """Refresh the coalesced reads and reminders after a committed write; todo is None for deletes"""
+    flight = current_app.extensions.get('singleflight')
+    if flight is not None:
+        # Reads arriving after this write must not join a flight that started before it
+        flight.forget()
+    reminders = current_app.extensions.get('reminders')
+    if reminders is not None:
+        if todo is None:
+            reminders.remove(id)
+        else:
+            due_date = datetime.fromisoformat(todo['due_date']) if todo['due_date'] else None
+            reminders.update(id, due_date, todo['completed'])
+
+def json_response(body, headers=None):
+    """Wrap an already serialized JSON body"""
+    return current_app.response_class(body, mimetype='application/json', headers=headers)
+
+def raise_missing(id, versions):
+    """Explain why a versioned write matched no rows: stale If-Match or unknown id"""
+    if versions is not None and db.session.query(Todo.id).filter_by(id=id).first() is not None:
+        raise PreconditionFailed(f"Todo {id} does not match If-Match")
+    raise NotFound()
+
 @bp.route('/protected', methods=['POST'])
 def protected_route():
     """A route that requires CSRF protection"""
@@ -137,16 +262,35 @@ def protected_route():
 
 @ns.route('/')
 class TodoList(Resource):
-    method_decorators = [add_response_headers, csrf.exempt]  # Add CSRF exemption to all methods
+    method_decorators = [coalesce_reads, add_response_headers, csrf.exempt]  # Add CSRF exemption to all methods
 
-    @ns.doc('list_todos')
-    @ns.marshal_list_with(todo_model)
+    @ns.doc('list_todos', params={
+        'include_archived': 'Also return archived todos',
+        'tag': 'Only return todos with this tag'
+    })
+    @ns.response(200, 'Success', [todo_model])
     def get(self):
         """List all todos"""
         try:
             logger.info('Fetching all todos')
-            todos = Todo.query.all()
-            return [todo.to_dict() for todo in todos], HTTPStatus.OK
+            include_archived = request.args.get('include_archived', '').lower() in ('1', 'true', 'yes')
+            tag = request.args.get('tag')
+
+            snapshot = None if include_archived or tag is not None else get_snapshot()
+            if snapshot is not None:
+                body = snapshot.list_body()
+                if body is not None:
+                    return json_response(body)
+
+            # Tags and subtasks are batch loaded by their selectin relationships
+            query = Todo.query
+            if tag is not None:
+                query = query.join(Todo.tags).filter(Tag.name == tag)
+            todos = [todo.to_dict() for todo in query.order_by(Todo.id)]
+            if include_archived:
+                archived = [todo.to_dict() for todo in list_archived()]
+                todos += [todo for todo in archived if tag is None or tag in todo['tags']]
+            return marshal(todos, todo_model), HTTPStatus.OK
         except Exception as e:
             logger.error(f"Error fetching todos: {str(e)}", exc_info=True)
             raise
@@ -163,18 +307,25 @@ class TodoList(Resource):
             if not data or 'title' not in data:
                 raise BadRequest("Title is required")
                 
+            check_parent(None, data.get('parent_id'))
             todo = Todo(
                 title=data['title'],
                 description=data.get('description', ''),
                 due_date=datetime.fromisoformat(data['due_date']) if 'due_date' in data else None,
-                completed=data.get('completed', False)
+                completed=data.get('completed', False),
+                parent_id=data.get('parent_id')
             )
+            if 'tags' in data:
+                todo.tags = resolve_tags(data['tags'])
             
             db.session.add(todo)
             db.session.commit()
             logger.info(f"Created todo with id {todo.id}")
+
+            result = todo.to_dict()
+            after_write(todo.id, result)
             
-            return todo.to_dict(), HTTPStatus.CREATED
+            return result, HTTPStatus.CREATED, {'ETag': todo_etag(result['version'])}
         except ValueError as e:
             logger.warning(f"Invalid data format: {str(e)}")
             raise BadRequest(f"Invalid data format: {str(e)}")
@@ -182,23 +333,82 @@ class TodoList(Resource):
             logger.error(f"Error creating todo: {str(e)}", exc_info=True)
             raise
 
+@ns.route('/due')
+class DueTodos(Resource):
+    method_decorators = [coalesce_reads, add_response_headers, csrf.exempt]  # Add CSRF exemption to all methods
+
+    @ns.doc('list_due_todos', params={
+        'within': 'How far ahead to look, e.g. 30m, 1h or 2d (default 1h)',
+        'overdue': 'Also return todos already past due (default true)'
+    })
+    @ns.response(200, 'Success', [todo_model])
+    def get(self):
+        """List incomplete todos due soon, earliest first"""
+        try:
+            within = parse_window(request.args.get('within', '1h'))
+            include_overdue = request.args.get('overdue', 'true').lower() in ('1', 'true', 'yes')
+            logger.info(f'Fetching todos due within {within}')
+            todos = [todo.to_dict() for todo in due_soon(within, include_overdue)]
+            return marshal(todos, todo_model), HTTPStatus.OK
+        except ValueError as e:
+            logger.warning(f"Invalid window: {str(e)}")
+            raise BadRequest(str(e))
+        except Exception as e:
+            logger.error(f"Error fetching due todos: {str(e)}", exc_info=True)
+            raise
+
 @ns.route('/<int:id>')
 @ns.param('id', 'The todo identifier')
 class TodoItem(Resource):
-    method_decorators = [add_response_headers, csrf.exempt]  # Add CSRF exemption to all methods
+    method_decorators = [coalesce_reads, add_response_headers, csrf.exempt]  # Add CSRF exemption to all methods
 
     @ns.doc('get_todo')
-    @ns.marshal_with(todo_model)
+    @ns.response(200, 'Success', todo_model)
     def get(self, id):
         """Get a specific todo"""
         try:
             logger.info(f'Fetching todo with id {id}')
-            todo = Todo.query.get_or_404(id)
-            return todo.to_dict(), HTTPStatus.OK
+            snapshot = get_snapshot()
+            cached = snapshot.item(id) if snapshot is not None else None
+            if cached is not None:
+                version, body = cached
+                return json_response(body, {'ETag': todo_etag(version)})
+
+            todo = db.session.get(Todo, id) or get_archived(id)
+            if todo is None:
+                raise NotFound()
+            return marshal(todo.to_dict(), todo_model), HTTPStatus.OK, {'ETag': todo_etag(todo.version)}
         except Exception as e:
             logger.error(f"Error fetching todo {id}: {str(e)}", exc_info=True)
             raise
 
+    def _update(self, id):
+        """Apply a partial update with one UPDATE ... RETURNING statement"""
+        data = request.get_json()
+        versions = if_match_versions()
+        if 'parent_id' in data:
+            check_parent(id, data['parent_id'])
+
+        stmt = update(Todo).where(Todo.id == id)
+        if versions is not None:
+            stmt = stmt.where(Todo.version.in_(versions))
+        stmt = stmt.values(**update_values(data), version=Todo.version + 1).returning(Todo)
+
+        todo = db.session.execute(stmt).scalar_one_or_none()
+        if todo is None:
+            db.session.rollback()
+            raise_missing(id, versions)
+        if 'tags' in data:
+            todo.tags = resolve_tags(data['tags'])
+
+        # Serialize before commit so expired attributes are not reloaded
+        result = todo.to_dict()
+        db.session.commit()
+        logger.info(f"Updated todo {id}")
+        after_write(id, result)
+
+        return result, HTTPStatus.OK, {'ETag': todo_etag(result['version'])}
+
     @ns.doc('update_todo')
     @ns.expect(todo_input)
     @ns.marshal_with(todo_model)
@@ -206,22 +416,7 @@ class TodoItem(Resource):
         """Update a todo"""
         try:
             logger.info(f'Updating todo with id {id}')
-            todo = Todo.query.get_or_404(id)
-            data = request.get_json()
-            
-            if 'title' in data:
-                todo.title = data['title']
-            if 'description' in data:
-                todo.description = data['description']
-            if 'due_date' in data:
-                todo.due_date = datetime.fromisoformat(data['due_date'])
-            if 'completed' in data:
-                todo.completed = data['completed']
-                
-            db.session.commit()
-            logger.info(f"Updated todo {id}")
-            
-            return todo.to_dict(), HTTPStatus.OK
+            return self._update(id)
         except ValueError as e:
             logger.warning(f"Invalid data format: {str(e)}")
             raise BadRequest(f"Invalid data format: {str(e)}")
@@ -229,30 +424,88 @@ class TodoItem(Resource):
             logger.error(f"Error updating todo {id}: {str(e)}", exc_info=True)
             raise
 
+    @ns.doc('patch_todo')
+    @ns.expect(todo_input)
+    @ns.marshal_with(todo_model)
+    @ns.response(412, 'If-Match does not match the current version')
+    def patch(self, id):
+        """Partially update a todo"""
+        try:
+            logger.info(f'Patching todo with id {id}')
+            return self._update(id)
+        except ValueError as e:
+            logger.warning(f"Invalid data format: {str(e)}")
+            raise BadRequest(f"Invalid data format: {str(e)}")
+        except Exception as e:
+            logger.error(f"Error patching todo {id}: {str(e)}", exc_info=True)
+            raise
+
     @ns.doc('delete_todo')
     @ns.response(204, 'Todo deleted')
+    @ns.response(412, 'If-Match does not match the current version')
     def delete(self, id):
         """Delete a todo"""
         try:
             logger.info(f'Deleting todo with id {id}')
-            todo = Todo.query.get_or_404(id)
-            db.session.delete(todo)
+            versions = if_match_versions()
+
+            stmt = delete(Todo).where(Todo.id == id)
+            if versions is not None:
+                stmt = stmt.where(Todo.version.in_(versions))
+
+            deleted = db.session.execute(stmt.returning(Todo.id)).scalar_one_or_none()
+            if deleted is None:
+                db.session.rollback()
+                raise_missing(id, versions)
+
             db.session.commit()
             logger.info(f"Deleted todo {id}")
+            after_write(id)
             
             return '', HTTPStatus.NO_CONTENT
         except Exception as e:
             logger.error(f"Error deleting todo {id}: {str(e)}", exc_info=True)
             raise
 
-# Add a before_request handler for OPTIONS requests
-@bp.before_request
-def handle_options():
-    if request.method == 'OPTIONS':
-        response = make_response()
-        response.status_code = HTTPStatus.OK
-        response = add_cors_headers(response)
-        return response
+def require_admin_key(f):
+    """Reject requests that do not carry the configured ADMIN_API_KEY"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        expected = current_app.config.get('ADMIN_API_KEY')
+        provided = request.headers.get('X-API-KEY', '')
+        if not expected or not hmac.compare_digest(provided, expected):
+            raise Forbidden("A valid X-API-KEY is required")
+        return f(*args, **kwargs)
+    return decorated_function
+
+@admin_ns.route('/stats')
+class Stats(Resource):
+    method_decorators = [add_response_headers, require_admin_key, csrf.exempt]
+
+    @admin_ns.doc('get_stats', security='apikey')
+    def get(self):
+        """Report request coalescing counters"""
+        flight = current_app.extensions.get('singleflight')
+        return {'singleflight': flight.stats() if flight is not None else None}, HTTPStatus.OK
+
+@admin_ns.route('/backup')
+class Backup(Resource):
+    method_decorators = [add_response_headers, require_admin_key, csrf.exempt]
+
+    @admin_ns.doc('create_backup', security='apikey', params={'compress': 'Gzip the backup file'})
+    @admin_ns.marshal_with(backup_model, code=201)
+    def post(self):
+        """Take an online backup of the database"""
+        try:
+            compress = request.args.get('compress', '').lower() in ('1', 'true', 'yes')
+            logger.info('Creating database backup')
+            stats = backup_database(default_backup_path(compress), compress=compress)
+            stats['path'] = os.path.basename(stats['path'])
+            stats['archive_path'] = os.path.basename(stats['archive']['path']) if stats['archive'] else None
+            return stats, HTTPStatus.CREATED
+        except Exception as e:
+            logger.error(f"Error creating backup: {str(e)}", exc_info=True)
+            raise
 
 # Register error handlers for the API
 @ns.errorhandler(Exception)
@@ -0,0 +1,72 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent identical computations into one.
+
+    The first caller for a key runs the computation; callers that arrive while
+    it is in flight wait for it and share its result or exception. Nothing is
+    kept once the computation finishes, so results are never served stale.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {'leaders': 0, 'coalesced': 0, 'timeouts': 0, 'errors': 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats['leaders'] += 1
+            else:
+                self._stats['coalesced'] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+                return call.result
+            except Exception as e:
+                call.error = e
+                with self._lock:
+                    self._stats['errors'] += 1
+                raise
+            finally:
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+                call.done.set()
+
+        if not call.done.wait(self.timeout):
+            # Give up on a stuck leader rather than failing the request
+            with self._lock:
+                self._stats['timeouts'] += 1
+            logger.warning(f"Timed out waiting for in-flight {key}, computing independently")
+            return fn()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def forget(self):
+        """Make later callers start fresh computations, e.g. after a write"""
+        with self._lock:
+            self._calls.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
@@ -0,0 +1,222 @@
+import os
+import mmap
+import fcntl
+import struct
+import bisect
+import logging
+import threading
+from itertools import chain
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .models import Todo, Tag, todo_tags
+
+logger = logging.getLogger(__name__)
+
+# Tables whose contents appear in the serialized todo list
+TRACKED_TABLES = {Todo.__tablename__, Tag.__tablename__, todo_tags.name}
+
+MAGIC = b'TSNP'
+FORMAT_VERSION = 1
+# magic, format version, generation, item count, list body offset, list body length
+HEADER = struct.Struct('<4sIQQQQ')
+# current generation (0 when invalidated), last generation ever published
+CONTROL = struct.Struct('<QQ')
+
+
+class TodoSnapshot:
+    """Pre-serialized todo list shared by every worker through memory-mapped files.
+
+    A small control file holds the current generation number. Generation
+    numbers only ever increase, so a worker never mistakes a new file for one
+    it has already mapped. Each generation is an immutable file laid out as::
+
+        header | ids[count] | versions[count] | offsets[count] | lengths[count] | list body
+
+    where the id array is sorted and ``offsets``/``lengths`` locate each item's
+    JSON inside the list body. Writers build the next generation under an
+    exclusive flock and then bump the control file, which readers check on every
+    request without a system call. Generation 0 means there is no valid snapshot.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.control_path = f'{path}.gen'
+        self._lock = threading.Lock()
+        self._current = None  # (generation, mmap, ids, versions, offsets, lengths, list_slice)
+
+        fd = os.open(self.control_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < CONTROL.size:
+                os.ftruncate(fd, CONTROL.size)
+            self._control = mmap.mmap(fd, CONTROL.size)
+        finally:
+            os.close(fd)
+
+    def generation(self):
+        return CONTROL.unpack_from(self._control)[0]
+
+    def _generation_path(self, generation):
+        return f'{self.path}.{generation}'
+
+    def _load(self, generation):
+        """Map a generation file, returning None if it was already replaced"""
+        try:
+            with open(self._generation_path(generation), 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        magic, version, file_generation, count, list_offset, list_length = HEADER.unpack_from(mm)
+        if magic != MAGIC or version != FORMAT_VERSION or file_generation != generation:
+            return None
+
+        view = memoryview(mm)
+        arrays = []
+        start = HEADER.size
+        for _ in range(4):
+            arrays.append(view[start:start + 8 * count].cast('Q'))
+            start += 8 * count
+        ids, versions, offsets, lengths = arrays
+        return (generation, mm, ids, versions, offsets, lengths, view[list_offset:list_offset + list_length])
+
+    def _snapshot(self):
+        generation = self.generation()
+        current = self._current
+        if current is not None and current[0] == generation:
+            return current
+        if generation == 0:
+            return None
+        with self._lock:
+            if self._current is None or self._current[0] != generation:
+                self._current = self._load(generation)
+            return self._current
+
+    def list_body(self):
+        """Return the serialized list, or None when there is no valid snapshot"""
+        current = self._snapshot()
+        return bytes(current[6]) if current is not None else None
+
+    def item(self, id):
+        """Return (version, serialized item) for an id, or None if it is not in the snapshot"""
+        current = self._snapshot()
+        if current is None:
+            return None
+        _, mm, ids, versions, offsets, lengths, _ = current
+        i = bisect.bisect_left(ids, id)
+        if i == len(ids) or ids[i] != id:
+            return None
+        return versions[i], mm[offsets[i]:offsets[i] + lengths[i]]
+
+    def has_snapshot(self):
+        return self._snapshot() is not None
+
+    def _set_generation(self, generation):
+        last = max(generation, CONTROL.unpack_from(self._control)[1])
+        CONTROL.pack_into(self._control, 0, generation, last)
+        self._control.flush()
+
+    def publish(self, build, only_if_missing=False):
+        """Build and publish a new generation.
+
+        ``build`` is called while holding the writer lock and must return
+        ``(id, version, body)`` tuples sorted by id, where body is the item's
+        JSON. Querying inside the lock means the last publisher always sees
+        every committed write. With only_if_missing, workers that lost the race
+        to rebuild an invalidated snapshot reuse the winner's generation.
+        """
+        with open(self.control_path, 'rb') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                previous, last = CONTROL.unpack_from(self._control)
+                if only_if_missing and previous:
+                    return previous
+                generation = last + 1
+                items = build()
+                count = len(items)
+
+                list_offset = HEADER.size + 4 * 8 * count
+                offsets = []
+                position = list_offset + 1
+                for _, _, body in items:
+                    offsets.append(position)
+                    position += len(body) + 1
+                body = b'[' + b','.join(item[2] for item in items) + b']'
+
+                tmp_path = f'{self._generation_path(generation)}.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(HEADER.pack(MAGIC, FORMAT_VERSION, generation, count, list_offset, len(body)))
+                    f.write(struct.pack(f'<{count}Q', *(item[0] for item in items)))
+                    f.write(struct.pack(f'<{count}Q', *(item[1] for item in items)))
+                    f.write(struct.pack(f'<{count}Q', *offsets))
+                    f.write(struct.pack(f'<{count}Q', *(len(item[2]) for item in items)))
+                    f.write(body)
+                os.replace(tmp_path, self._generation_path(generation))
+
+                self._set_generation(generation)
+                self._remove_generation(previous)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        logger.info(f"Published todo snapshot generation {generation} with {count} items")
+        return generation
+
+    def invalidate(self):
+        """Stop serving the snapshot until the next publish"""
+        with open(self.control_path, 'rb') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                previous = self.generation()
+                self._set_generation(0)
+                self._remove_generation(previous)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _remove_generation(self, generation):
+        # Readers that already mapped the file keep it until they move on
+        if generation:
+            try:
+                os.remove(self._generation_path(generation))
+            except FileNotFoundError:
+                pass
+
+
+def snapshot_path(app, engine):
+    """Place the snapshot next to the SQLite file so every worker on that database shares it"""
+    if app.config['SNAPSHOT_PATH']:
+        return app.config['SNAPSHOT_PATH']
+    database = engine.url.database
+    if engine.dialect.name != 'sqlite' or not database or database == ':memory:':
+        return None
+    return f'{database}.snapshot'
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_flush(session, flush_context):
+    if any(isinstance(obj, (Todo, Tag)) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info['todo_changed'] = True
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_bulk(orm_execute_state):
+    statement = orm_execute_state.statement
+    if (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete) \
+            and getattr(statement.table, 'name', None) in TRACKED_TABLES:
+        orm_execute_state.session.info['todo_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    # Any committed todo write makes the snapshot stale; the next read rebuilds it
+    if session.info.pop('todo_changed', False) and has_app_context():
+        snapshot = current_app.extensions.get('snapshot')
+        if snapshot is not None:
+            # The write is already committed, so a snapshot error must not turn it into one
+            try:
+                snapshot.invalidate()
+            except Exception as e:
+                logger.error(f"Error invalidating todo snapshot: {str(e)}", exc_info=True)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _reset_on_rollback(session):
+    session.info.pop('todo_changed', None)
@@ -0,0 +1,242 @@
+import io
+import os
+import re
+import json
+import time
+import logging
+import tempfile
+import threading
+import statistics
+from datetime import datetime
+from urllib.parse import parse_qsl, urlencode
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask.cli import AppGroup
+
+logger = logging.getLogger(__name__)
+
+traffic_cli = AppGroup('traffic', help='Replay captured request traces.')
+
+MAX_CAPTURED_BODY = 64 * 1024
+# Query values that carry no user content and are kept verbatim
+SAFE_QUERY_VALUE = re.compile(r'^(true|false|yes|no|\d+[smhdw]?)$', re.IGNORECASE)
+ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+
+def body_shape(value):
+    """Reduce a JSON value to its structure so no user content is recorded"""
+    if isinstance(value, dict):
+        return {key: body_shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [body_shape(value[0])] if value else []
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, (int, float)):
+        return 'num'
+    if value is None:
+        return 'null'
+    try:
+        datetime.fromisoformat(value)
+        return 'datetime'
+    except ValueError:
+        return 'str'
+
+
+def sanitize_query(query_string):
+    return {key: value if SAFE_QUERY_VALUE.match(value) else '*'
+            for key, value in parse_qsl(query_string, keep_blank_values=True)}
+
+
+def endpoint_key(method, path):
+    """Group requests by method and route, e.g. ``GET /todos/<id>``"""
+    return f"{method} {ID_SEGMENT.sub('/<id>', path)}"
+
+
+class CaptureMiddleware:
+    """Append a sanitized NDJSON trace line for every request.
+
+    Each line holds the wall-clock start time, method, path, query keys with
+    non-trivial values masked, the JSON body shape, the status and the time the
+    application took. Lines are written with one O_APPEND write, so several
+    workers can share a capture file.
+    """
+
+    def __init__(self, wsgi_app, path):
+        self.wsgi_app = wsgi_app
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _shape(self, environ):
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return None
+        if not length or length > MAX_CAPTURED_BODY:
+            return None
+        body = environ['wsgi.input'].read(length)
+        environ['wsgi.input'] = io.BytesIO(body)
+        if 'json' not in environ.get('CONTENT_TYPE', ''):
+            return None
+        try:
+            return body_shape(json.loads(body))
+        except ValueError:
+            return None
+
+    def __call__(self, environ, start_response):
+        started = time.time()
+        record = {
+            't': round(started, 4),
+            'm': environ['REQUEST_METHOD'],
+            'p': environ.get('PATH_INFO', '/'),
+        }
+        query = sanitize_query(environ.get('QUERY_STRING', ''))
+        if query:
+            record['q'] = query
+        shape = self._shape(environ)
+        if shape is not None:
+            record['b'] = shape
+
+        def capture_start_response(status, headers, exc_info=None):
+            record['s'] = int(status.split(' ', 1)[0])
+            return start_response(status, headers, exc_info)
+
+        try:
+            return self.wsgi_app(environ, capture_start_response)
+        finally:
+            record['d'] = round((time.time() - started) * 1000, 3)
+            try:
+                os.write(self.fd, json.dumps(record, separators=(',', ':')).encode() + b'\n')
+            except OSError as e:
+                logger.warning(f"Could not write traffic capture: {str(e)}")
+
+
+def load_trace(path):
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return sorted(records, key=lambda record: record['t'])
+
+
+def synthesize_body(shape):
+    """Build a request body with the captured shape and placeholder values"""
+    if isinstance(shape, dict):
+        return {key: synthesize_body(item) for key, item in shape.items()}
+    if isinstance(shape, list):
+        return [synthesize_body(item) for item in shape]
+    return {
+        'bool': False,
+        'num': 1,
+        'null': None,
+        'datetime': datetime.utcnow().replace(microsecond=0).isoformat(),
+    }.get(shape, 'replay')
+
+
+def replay(app, records, speed=1.0, concurrency=8):
+    """Re-issue captured requests against an app and collect per-request latencies.
+
+    Requests start at their captured offsets divided by ``speed``; a speed of 0
+    sends them back to back. Returns (endpoint, status, latency_ms) tuples.
+    """
+    local = threading.local()
+    results = []
+    results_lock = threading.Lock()
+
+    def issue(record):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        query = '?' + urlencode({k: 'x' if v == '*' else v for k, v in record.get('q', {}).items()}) \
+            if record.get('q') else ''
+        kwargs = {'json': synthesize_body(record['b'])} if 'b' in record else {}
+        started = time.perf_counter()
+        response = client.open(record['p'] + query, method=record['m'], base_url='https://localhost', **kwargs)
+        latency = (time.perf_counter() - started) * 1000
+        response.close()
+        with results_lock:
+            results.append((endpoint_key(record['m'], record['p']), response.status_code, latency))
+
+    if not records:
+        return results
+    origin = records[0]['t']
+    clock = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = []
+        for record in records:
+            if speed:
+                delay = (record['t'] - origin) / speed - (time.perf_counter() - clock)
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append(pool.submit(issue, record))
+        for future in futures:
+            future.result()
+    return results
+
+
+def latency_report(results):
+    """Summarize latencies by endpoint"""
+    by_endpoint = {}
+    for endpoint, status, latency in results:
+        by_endpoint.setdefault(endpoint, []).append((status, latency))
+
+    report = {}
+    for endpoint, samples in sorted(by_endpoint.items()):
+        latencies = sorted(latency for _, latency in samples)
+        pick = lambda pct: latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))]
+        report[endpoint] = {
+            'count': len(samples),
+            'errors': sum(1 for status, _ in samples if status >= 500),
+            'non_2xx': sum(1 for status, _ in samples if not 200 <= status < 300),
+            'mean_ms': round(statistics.mean(latencies), 3),
+            'p50_ms': round(pick(50), 3),
+            'p95_ms': round(pick(95), 3),
+            'p99_ms': round(pick(99), 3),
+            'max_ms': round(latencies[-1], 3),
+        }
+    return report
+
+
+def seed_count(records):
+    """The highest todo id the trace refers to, so those ids exist before replay"""
+    ids = [int(match) for record in records for match in re.findall(r'/todos/(\d+)', record['p'])]
+    return max(ids, default=0)
+
+
+@traffic_cli.command('replay')
+@click.argument('trace', type=click.Path(exists=True, dir_okay=False))
+@click.option('--speed', type=float, default=1.0, show_default=True,
+              help='Time scale; 2 replays twice as fast, 0 sends requests back to back.')
+@click.option('--concurrency', type=int, default=8, show_default=True, help='Requests in flight at once.')
+@click.option('--database', help='Database URI for the replay app (default: a temporary SQLite file).')
+@click.option('--seed', type=int, help='Todos to create first (default: highest id in the trace).')
+@click.option('--json-report', 'json_report', is_flag=True, help='Print the report as JSON.')
+def replay_command(trace, speed, concurrency, database, seed, json_report):
+    """Replay a captured TRACE against a fresh application instance."""
+    from . import create_app, db
+    from .models import Todo
+
+    records = load_trace(trace)
+    if database is None:
+        database = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'replay.db')}"
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': database,
+        'WTF_CSRF_ENABLED': False,
+        'TRAFFIC_CAPTURE_PATH': None,
+    })
+
+    with app.app_context():
+        count = seed_count(records) if seed is None else seed
+        if count:
+            db.session.execute(Todo.__table__.insert(), [{'title': f'Seed {i}', 'completed': 0} for i in range(count)])
+            db.session.commit()
+
+    started = time.perf_counter()
+    results = replay(app, records, speed=speed, concurrency=concurrency)
+    elapsed = time.perf_counter() - started
+    report = latency_report(results)
+
+    if json_report:
+        click.echo(json.dumps(report, indent=2))
+        return
+    click.echo(f"Replayed {len(results)} requests in {elapsed:.2f}s at speed {speed} with concurrency {concurrency}")
+    click.echo(f"{'endpoint':<32}{'count':>7}{'non2xx':>8}{'5xx':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for endpoint, row in report.items():
+        click.echo(f"{endpoint:<32}{row['count']:>7}{row['non_2xx']:>8}{row['errors']:>6}"
+                   f"{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}{row['max_ms']:>9.2f}")
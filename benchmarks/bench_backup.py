@@ -0,0 +1,93 @@
+"""Measure online backup throughput and its impact on concurrent writers.
+
+Usage: python benchmarks/bench_backup.py [--rows N] [--pages N] [--pause S]
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+import statistics
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models import Todo
+from app.backup import backup_database
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def write_loop(db_path, stop, latencies):
+    """Insert todos from a separate connection, like another gunicorn worker would"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    while not stop.is_set():
+        started = time.perf_counter()
+        conn.execute("INSERT INTO todo (title, completed, version) VALUES ('bench', 0, 1)")
+        conn.commit()
+        latencies.append(time.perf_counter() - started)
+        time.sleep(0.001)
+    conn.close()
+
+
+def measure_writers(db_path, duration=None, during=None):
+    stop = threading.Event()
+    latencies = []
+    writer = threading.Thread(target=write_loop, args=(db_path, stop, latencies))
+    writer.start()
+    result = during() if during else time.sleep(duration)
+    stop.set()
+    writer.join()
+    return latencies, result
+
+
+def report(label, latencies):
+    ms = [l * 1000 for l in latencies]
+    print(f"{label:<22} writes={len(ms):<6} p50={statistics.median(ms):.3f}ms "
+          f"p99={percentile(ms, 99):.3f}ms max={max(ms):.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--pages', type=int, default=256)
+    parser.add_argument('--pause', type=float, default=0.005)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, 'todos.db')
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'BACKUP_DIR': workdir,
+    })
+
+    with app.app_context():
+        db.session.execute(Todo.__table__.insert(), [
+            {'title': f'Todo {i}', 'description': 'x' * 400, 'completed': i % 2} for i in range(args.rows)
+        ])
+        db.session.commit()
+        size_mb = os.path.getsize(db_path) / 1e6
+        print(f"database: {size_mb:.1f} MB, {args.rows} rows, {args.pages} pages/step, {args.pause}s pause")
+
+        baseline, _ = measure_writers(db_path, duration=1.0)
+        report('writers (idle)', baseline)
+
+        for compress in (False, True):
+            dest = os.path.join(workdir, 'backup.db' + ('.gz' if compress else ''))
+            during, stats = measure_writers(db_path, during=lambda: backup_database(
+                dest, pages=args.pages, step_pause=args.pause, compress=compress))
+            label = 'writers (backup+gzip)' if compress else 'writers (backup)'
+            report(label, during)
+            print(f"{'backup':<22} {stats['bytes'] / 1e6 / stats['seconds']:.1f} MB/s "
+                  f"steps={stats['steps']} restarts={stats['restarts']} stored={stats['stored_bytes'] / 1e6:.1f} MB "
+                  f"seconds={stats['seconds']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Measure per-request overhead of response header processing.
+
+Usage: python benchmarks/bench_headers.py [--requests N]
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models import Todo
+
+
+def timed(client, method, path, requests, **kwargs):
+    call = getattr(client, method)
+    call(path, **kwargs)
+    started = time.perf_counter()
+    for _ in range(requests):
+        call(path, **kwargs)
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'WTF_CSRF_CHECK_DEFAULT': False,
+    })
+    with app.app_context():
+        db.session.add(Todo(title='Bench'))
+        db.session.commit()
+
+        client = app.test_client()
+        cases = [
+            ('OPTIONS /todos/ (preflight)', 'options', '/todos/', {'headers': {
+                'Origin': 'https://example.com', 'Access-Control-Request-Method': 'POST'}}),
+            ('GET /todos/1', 'get', '/todos/1', {}),
+            ('GET /todos/', 'get', '/todos/', {}),
+            ('GET /swagger.json', 'get', '/swagger.json', {}),
+        ]
+        for label, method, path, kwargs in cases:
+            us = timed(client, method, path, args.requests, base_url='https://localhost', **kwargs)
+            print(f"{label:<30} {us:8.1f} us/request")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Compare reads and writes with the shared snapshot against plain database access.
+
+Usage: python benchmarks/bench_snapshot.py [--rows N] [--requests N] [--writes N]
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app, db
+from app.models import Todo
+
+
+def timed(client, path, requests):
+    client.get(path)
+    started = time.perf_counter()
+    for _ in range(requests):
+        client.get(path)
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+def timed_writes(client, rows, requests):
+    """Average latency of a PATCH and a POST, each of which invalidates the snapshot"""
+    started = time.perf_counter()
+    for i in range(requests):
+        client.patch(f'/todos/{i % rows + 1}', json={'completed': bool(i % 2)})
+    patch_us = (time.perf_counter() - started) / requests * 1e6
+    started = time.perf_counter()
+    for i in range(requests):
+        client.post('/todos/', json={'title': f'Bench {i}'})
+    post_us = (time.perf_counter() - started) / requests * 1e6
+    return patch_us, post_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--writes', type=int, default=50)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    workdir = tempfile.mkdtemp()
+    app = create_app({
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'SNAPSHOT_ENABLED': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(workdir, "todos.db")}',
+    })
+    with app.app_context():
+        db.session.execute(Todo.__table__.insert(), [
+            {'title': f'Todo {i}', 'description': 'x' * 100, 'completed': i % 2} for i in range(args.rows)
+        ])
+        db.session.commit()
+
+        client = app.test_client()
+        snapshot = app.extensions['snapshot']
+        for label in ('snapshot', 'database'):
+            list_us = timed(client, '/todos/', args.requests)
+            item_us = timed(client, f'/todos/{args.rows // 2}', args.requests)
+            patch_us, post_us = timed_writes(client, args.rows, args.writes)
+            print(f"{label:<10} GET /todos/ {list_us:9.1f} us   GET /todos/<id> {item_us:7.1f} us   "
+                  f"PATCH {patch_us:9.1f} us   POST {post_us:9.1f} us")
+            app.extensions.pop('snapshot', None)
+        app.extensions['snapshot'] = snapshot
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,10 @@ import os
 import sys
 import logging
 import sqlite3
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateTable
 from app import create_app, db
+from app.models import Todo
 
 # Configure logging
 logging.basicConfig(
@@ -21,7 +24,7 @@ def verify_table_schema(db_path):
         cursor.execute("PRAGMA table_info(todo)")
         columns = {row[1] for row in cursor.fetchall()}
         
-        required_columns = {'id', 'title', 'description', 'completed', 'due_date', 'created_at'}
+        required_columns = {'id', 'title', 'description', 'completed', 'due_date', 'created_at', 'version', 'parent_id', 'completed_at'}
         missing_columns = required_columns - columns
         
         if missing_columns:
@@ -38,6 +41,122 @@ def verify_table_schema(db_path):
         if 'conn' in locals():
             conn.close()
 
+# Columns added after the initial schema: (table, column, definition)
+ADDED_COLUMNS = [
+    ('todo', 'version', 'INTEGER NOT NULL DEFAULT 1'),
+    ('todo', 'parent_id', 'INTEGER REFERENCES todo(id) ON DELETE SET NULL'),
+    ('todo', 'completed_at', 'DATETIME'),
+    ('todo_archive', 'parent_id', 'INTEGER'),
+    ('todo_archive', 'tags', "TEXT NOT NULL DEFAULT '[]'"),
+    ('todo_archive', 'completed_at', 'DATETIME'),
+]
+
+def add_columns(cursor):
+    """Add any ADDED_COLUMNS missing from tables that exist in this file"""
+    for table, column, definition in ADDED_COLUMNS:
+        cursor.execute(f"PRAGMA table_info({table})")
+        columns = {row[1] for row in cursor.fetchall()}
+
+        if columns and column not in columns:
+            logger.info(f"Adding {column} column to {table} table")
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def convert_to_incremental_vacuum(db_path):
+    """Switch an existing file to auto_vacuum=INCREMENTAL, which needs one full VACUUM"""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            logger.info(f"Running a one-time VACUUM to enable incremental vacuum on {db_path}")
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+def rebuild_todo_table(conn):
+    """Recreate the todo table with AUTOINCREMENT so ids of archived rows are never reused"""
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA table_info(todo)")
+    present = {row[1] for row in cursor.fetchall()}
+    columns = ', '.join(column.name for column in Todo.__table__.columns if column.name in present)
+    create = str(CreateTable(Todo.__table__).compile(dialect=sqlite.dialect())).strip()
+    create = create.replace('CREATE TABLE todo (', 'CREATE TABLE todo_new (', 1)
+
+    # SQLite cannot add AUTOINCREMENT in place: copy into a new table and swap it in
+    conn.commit()
+    conn.execute("PRAGMA foreign_keys=OFF")
+    conn.executescript(f"""
+        BEGIN;
+        {create};
+        INSERT INTO todo_new ({columns}) SELECT {columns} FROM todo;
+        DROP TABLE todo;
+        ALTER TABLE todo_new RENAME TO todo;
+        COMMIT;
+    """)
+
+def seed_todo_sequence(cursor, archive_path=None):
+    """Start new todo ids above every id already used by the hot table or the archive"""
+    used = [cursor.execute("SELECT COALESCE(MAX(id), 0) FROM todo").fetchone()[0]]
+    if archive_path:
+        archive = sqlite3.connect(archive_path)
+        try:
+            tables = archive.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='todo_archive'")
+            if tables.fetchone():
+                used.append(archive.execute("SELECT COALESCE(MAX(id), 0) FROM todo_archive").fetchone()[0])
+        finally:
+            archive.close()
+    elif cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='todo_archive'").fetchone():
+        used.append(cursor.execute("SELECT COALESCE(MAX(id), 0) FROM todo_archive").fetchone()[0])
+
+    used += [row[0] for row in cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'todo'")]
+    cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'todo'")
+    cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('todo', ?)", (max(used),))
+
+def upgrade_table_schema(db_path, archive_path=None):
+    """Add columns introduced after the initial schema without dropping data"""
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+
+        add_columns(cursor)
+
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='todo'")
+        row = cursor.fetchone()
+        if row:
+            if 'AUTOINCREMENT' not in row[0].upper():
+                logger.info("Rebuilding todo table with AUTOINCREMENT ids")
+                rebuild_todo_table(conn)
+            seed_todo_sequence(cursor, archive_path)
+            # Todos completed before completion times were recorded start their archive age now
+            cursor.execute("UPDATE todo SET completed_at = CURRENT_TIMESTAMP WHERE completed = 1 AND completed_at IS NULL")
+            cursor.execute("DROP INDEX IF EXISTS ix_todo_completed_created_at")
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_todo_completed_completed_at ON todo (completed, completed_at)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_todo_parent_id ON todo (parent_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_todo_completed_due_date ON todo (completed, due_date)")
+        conn.commit()
+
+        if archive_path:
+            archive = sqlite3.connect(archive_path)
+            try:
+                add_columns(archive.cursor())
+                archive.commit()
+            finally:
+                archive.close()
+
+        for path in filter(None, {db_path, archive_path}):
+            convert_to_incremental_vacuum(path)
+
+    except Exception as e:
+        logger.error(f"Error upgrading table schema: {str(e)}", exc_info=True)
+    finally:
+        if 'conn' in locals():
+            conn.close()
+
+def sqlite_path(uri):
+    """Return the file behind a sqlite:/// URI, or None for other databases"""
+    if uri and uri.startswith('sqlite:///') and ':memory:' not in uri:
+        return uri[len('sqlite:///'):]
+    return None
+
 def deploy():
     try:
         # Create the app with the database path
@@ -65,6 +184,8 @@ def deploy():
             logger.info(f"Checking database at {db_path}")
             
             if os.path.exists(db_path):
+                archive_path = sqlite_path(app.config['ARCHIVE_DATABASE_URI'])
+                upgrade_table_schema(db_path, archive_path)
                 if verify_table_schema(db_path):
                     logger.info("Existing database has correct schema")
                     return
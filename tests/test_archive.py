@@ -0,0 +1,162 @@
+import pytest
+from app import create_app, db
+from app.models import Todo, ArchivedTodo
+from app.archive import archive_completed, compact, Archiver
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+import json
+from datetime import datetime, timedelta
+
+@pytest.fixture
+def app():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'WTF_CSRF_CHECK_DEFAULT': False,
+        'SECRET_KEY': 'test-secret-key',
+        'ARCHIVE_AFTER_DAYS': 30
+    })
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def todos(app):
+    old = datetime.utcnow() - timedelta(days=60)
+    rows = [
+        Todo(title='Old done', completed=1, created_at=old, completed_at=old),
+        Todo(title='Old open', completed=0, created_at=old),
+        Todo(title='New done', completed=1),
+        Todo(title='Old done too', completed=1, created_at=old, completed_at=old),
+    ]
+    db.session.add_all(rows)
+    db.session.commit()
+    return rows
+
+def test_archive_moves_only_old_completed(app, todos):
+    """Test that only completed todos past the age limit are archived"""
+    moved = archive_completed(timedelta(days=30), batch_size=1)
+    assert moved == 2
+
+    assert {t.title for t in Todo.query.all()} == {'Old open', 'New done'}
+    assert {t.title for t in ArchivedTodo.query.all()} == {'Old done', 'Old done too'}
+
+def test_archived_todos_are_retrievable(client, todos):
+    """Test archived todos stay reachable by id and through include_archived"""
+    archived_id = todos[0].id
+    archive_completed(timedelta(days=30))
+
+    response = client.get('/todos/')
+    assert len(json.loads(response.data)) == 2
+
+    response = client.get('/todos/?include_archived=true')
+    data = json.loads(response.data)
+    assert len(data) == 4
+    assert sum(todo['archived'] for todo in data) == 2
+
+    response = client.get(f'/todos/{archived_id}')
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['title'] == 'Old done'
+    assert data['archived'] is True
+
+def test_archived_ids_are_not_reused(client, todos):
+    """Test new todos never collide with archived ids"""
+    last_id = todos[-1].id
+    archive_completed(timedelta(days=30))
+
+    response = client.post('/todos/', json={'title': 'Fresh'})
+    assert response.status_code == 201
+    assert json.loads(response.data)['id'] > last_id
+
+def test_archiver_run_once(app, todos):
+    """Test a scheduled archiver cycle archives and compacts"""
+    Archiver(app).run_once()
+    assert ArchivedTodo.query.count() == 2
+    compact(vacuum_pages=10)
+
+def test_archive_retry_skips_rows_already_copied(app, todos):
+    """Test a batch interrupted between its two commits can be rerun"""
+    db.session.add(ArchivedTodo(id=todos[0].id, title='Old done', completed=1,
+                                created_at=todos[0].created_at, version=todos[0].version))
+    db.session.commit()
+
+    assert archive_completed(timedelta(days=30)) == 2
+    assert ArchivedTodo.query.count() == 2
+
+def test_archive_refuses_to_overwrite_archived_ids(app, todos):
+    """Test an id collision fails instead of replacing the archived todo"""
+    db.session.add(ArchivedTodo(id=todos[0].id, title='Archived earlier', completed=1,
+                                created_at=datetime.utcnow() - timedelta(days=90)))
+    db.session.commit()
+
+    with pytest.raises(IntegrityError):
+        archive_completed(timedelta(days=30))
+    db.session.rollback()
+    assert db.session.get(ArchivedTodo, todos[0].id).title == 'Archived earlier'
+    assert Todo.query.count() == 4
+
+def test_archive_age_counts_from_completion(client, todos):
+    """Test an old todo completed just now stays in the hot table"""
+    old_open = todos[1].id
+    response = client.patch(f'/todos/{old_open}', json={'completed': True})
+    assert response.status_code == 200
+
+    archive_completed(timedelta(days=30))
+    assert db.session.get(Todo, old_open) is not None
+    assert db.session.get(Todo, old_open).completed_at is not None
+
+    client.patch(f'/todos/{old_open}', json={'completed': False})
+    db.session.expire_all()
+    assert db.session.get(Todo, old_open).completed_at is None
+
+def write_between_commits(monkeypatch, values, id):
+    """Run a concurrent UPDATE of todo id right after the archiver copies its batch"""
+    commit = db.session.commit
+    calls = []
+
+    def racing_commit():
+        commit()
+        calls.append(1)
+        if len(calls) == 1:
+            with db.engine.begin() as conn:
+                conn.execute(update(Todo).where(Todo.id == id).values(**values, version=Todo.version + 1))
+
+    monkeypatch.setattr(db.session, 'commit', racing_commit)
+
+def test_edit_while_archiving_is_kept(app, todos, monkeypatch):
+    """Test an edit between copy and delete keeps the edited todo instead of the stale copy"""
+    edited_id = todos[0].id
+    write_between_commits(monkeypatch, {'title': 'edited'}, edited_id)
+    assert archive_completed(timedelta(days=30)) == 1
+    monkeypatch.undo()
+
+    db.session.expire_all()
+    assert db.session.get(Todo, edited_id).title == 'edited'
+    assert db.session.get(ArchivedTodo, edited_id) is None
+
+    assert archive_completed(timedelta(days=30)) == 1
+    assert db.session.get(ArchivedTodo, edited_id).title == 'edited'
+
+def test_reopen_while_archiving_does_not_block_archival(app, client, todos, monkeypatch):
+    """Test a reopen between copy and delete leaves one live todo and later archiving still works"""
+    reopened_id = todos[0].id
+    write_between_commits(monkeypatch, {'completed': 0, 'completed_at': None}, reopened_id)
+    archive_completed(timedelta(days=30))
+    monkeypatch.undo()
+
+    ids = [todo['id'] for todo in json.loads(client.get('/todos/?include_archived=1').data)]
+    assert sorted(ids) == sorted(set(ids))
+    assert db.session.get(ArchivedTodo, reopened_id) is None
+
+    db.session.execute(update(Todo).where(Todo.id == reopened_id).values(
+        completed=1, completed_at=datetime.utcnow() - timedelta(days=60)))
+    db.session.commit()
+    assert archive_completed(timedelta(days=30)) == 1
+    assert db.session.get(ArchivedTodo, reopened_id) is not None
@@ -0,0 +1,129 @@
+import pytest
+from app import create_app, db
+from app.models import Todo, ArchivedTodo
+from app.backup import backup_database, restore_database, archive_backup_path
+import json
+import os
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "todos.db"}',
+        'WTF_CSRF_CHECK_DEFAULT': False,
+        'SECRET_KEY': 'test-secret-key',
+        'ADMIN_API_KEY': 'test-admin-key',
+        'BACKUP_DIR': str(tmp_path / 'backups'),
+        'BACKUP_PAGES_PER_STEP': 1
+    })
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Todo(title=f'Todo {i}', description='x' * 400) for i in range(50)])
+        db.session.commit()
+        yield app
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_backup_and_restore(app, tmp_path, compress):
+    """Test a stepped backup can be restored over later changes"""
+    dest = str(tmp_path / ('todos.db.gz' if compress else 'todos.db.bak'))
+    stats = backup_database(dest, compress=compress)
+    assert os.path.exists(dest)
+    assert stats['steps'] > 1
+    if compress:
+        assert stats['stored_bytes'] < stats['bytes']
+
+    Todo.query.delete()
+    db.session.commit()
+    assert Todo.query.count() == 0
+
+    restore_database(dest)
+    assert Todo.query.count() == 50
+
+def test_restore_rejects_corrupt_backup(app, tmp_path):
+    """Test a damaged backup never replaces the live database"""
+    dest = tmp_path / 'broken.db'
+    dest.write_bytes(b'SQLite format 3\x00' + b'\x00' * 200)
+    with pytest.raises(Exception):
+        restore_database(str(dest))
+    assert Todo.query.count() == 50
+
+def test_backup_endpoint_requires_key(client):
+    """Test the admin backup endpoint is protected by X-API-KEY"""
+    response = client.post('/admin/backup')
+    assert response.status_code == 403
+
+    response = client.post('/admin/backup?compress=true', headers={'X-API-KEY': 'test-admin-key'})
+    assert response.status_code == 201
+    data = json.loads(response.data)
+    assert data['path'].endswith('.db.gz')
+    assert data['bytes'] > 0
+
+def test_backup_cli(app, tmp_path):
+    """Test the backup CLI commands"""
+    runner = app.test_cli_runner()
+    dest = str(tmp_path / 'cli.db')
+    result = runner.invoke(args=['backup', 'create', dest])
+    assert result.exit_code == 0
+    assert os.path.exists(dest)
+
+    result = runner.invoke(args=['backup', 'restore', dest])
+    assert result.exit_code == 0
+
+@pytest.fixture
+def split_app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "todos.db"}',
+        'ARCHIVE_DATABASE_URI': f'sqlite:///{tmp_path / "archive.db"}',
+        'WTF_CSRF_CHECK_DEFAULT': False,
+        'SECRET_KEY': 'test-secret-key',
+        'ADMIN_API_KEY': 'test-admin-key',
+        'BACKUP_DIR': str(tmp_path / 'backups')
+    })
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Todo(title='Hot'), ArchivedTodo(id=100, title='Archived', completed=1)])
+        db.session.commit()
+        yield app
+        db.drop_all()
+
+def test_backup_includes_separate_archive(split_app, tmp_path):
+    """Test a separate archive database is backed up and restored with the main one"""
+    dest = str(tmp_path / 'todos.db.bak')
+    stats = backup_database(dest)
+    assert stats['archive']['path'] == archive_backup_path(dest)
+    assert os.path.exists(archive_backup_path(dest))
+
+    Todo.query.delete()
+    ArchivedTodo.query.delete()
+    db.session.commit()
+
+    restore_database(dest)
+    assert [todo.title for todo in Todo.query.all()] == ['Hot']
+    assert [todo.title for todo in ArchivedTodo.query.all()] == ['Archived']
+
+def test_restore_requires_archive_backup(split_app, tmp_path):
+    """Test a backup without its archive companion is refused before anything is restored"""
+    dest = str(tmp_path / 'todos.db.bak')
+    backup_database(dest)
+    os.remove(archive_backup_path(dest))
+    Todo.query.delete()
+    db.session.commit()
+
+    with pytest.raises(FileNotFoundError):
+        restore_database(dest)
+    assert Todo.query.count() == 0
+    assert ArchivedTodo.query.count() == 1
+
+def test_backup_endpoint_reports_archive(split_app):
+    """Test the admin endpoint names the archive backup file"""
+    response = split_app.test_client().post('/admin/backup', headers={'X-API-KEY': 'test-admin-key'})
+    data = json.loads(response.data)
+    assert data['archive_path'] == f"archive-{data['path']}"
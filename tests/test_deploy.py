@@ -0,0 +1,103 @@
+import pytest
+from app import create_app, db
+from app.archive import archive_completed
+from deploy import upgrade_table_schema
+from datetime import timedelta
+import json
+import sqlite3
+
+BASELINE_SCHEMA = """
+CREATE TABLE todo (
+    id INTEGER NOT NULL PRIMARY KEY,
+    title VARCHAR(100) NOT NULL,
+    description VARCHAR(500),
+    completed INTEGER NOT NULL,
+    due_date DATETIME,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL,
+    CONSTRAINT check_completed_boolean CHECK (completed IN (0, 1))
+);
+INSERT INTO todo (id, title, completed, created_at) VALUES
+    (1, 'old open', 0, datetime('now', '-60 days')),
+    (2, 'old done B', 1, datetime('now', '-60 days'));
+"""
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = tmp_path / 'todos.db'
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.close()
+    return path
+
+def make_app(db_path):
+    return create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'WTF_CSRF_CHECK_DEFAULT': False,
+        'SECRET_KEY': 'test-secret-key'
+    })
+
+def test_upgrade_keeps_rows_and_adds_autoincrement(db_path):
+    """Test a baseline database is rebuilt with AUTOINCREMENT without losing rows"""
+    upgrade_table_schema(str(db_path))
+
+    conn = sqlite3.connect(db_path)
+    table_sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'todo'").fetchone()[0]
+    rows = conn.execute('SELECT id, title, completed, version FROM todo ORDER BY id').fetchall()
+    conn.close()
+    assert 'AUTOINCREMENT' in table_sql
+    assert rows == [(1, 'old open', 0, 1), (2, 'old done B', 1, 1)]
+
+def test_upgrade_prepares_archival(db_path):
+    """Test completion times are backfilled, the archive index exists and free pages can be reclaimed"""
+    upgrade_table_schema(str(db_path))
+
+    conn = sqlite3.connect(db_path)
+    completed_at = conn.execute('SELECT completed_at FROM todo ORDER BY id').fetchall()
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+    conn.close()
+    assert completed_at[0][0] is None and completed_at[1][0] is not None
+    assert {'ix_todo_completed_completed_at', 'ix_todo_completed_due_date', 'ix_todo_parent_id'} <= indexes
+    assert auto_vacuum == 2
+
+    app = make_app(db_path)
+    with app.app_context():
+        assert archive_completed(timedelta(days=30)) == 0
+        db.session.remove()
+        db.engine.dispose()
+
+def test_upgraded_database_never_reuses_archived_ids(db_path):
+    """Test the highest archived id is not handed out again after an upgrade"""
+    upgrade_table_schema(str(db_path))
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE todo SET completed_at = datetime('now', '-60 days') WHERE completed = 1")
+    conn.commit()
+    conn.close()
+    app = make_app(db_path)
+    client = app.test_client()
+
+    with app.app_context():
+        assert archive_completed(timedelta(days=30)) == 1
+        response = client.post('/todos/', json={'title': 'Fresh'})
+        assert json.loads(response.data)['id'] == 3
+        assert json.loads(client.get('/todos/2').data)['title'] == 'old done B'
+        db.session.remove()
+        db.engine.dispose()
+
+def test_upgrade_seeds_ids_above_existing_archive(db_path):
+    """Test ids archived before the upgrade are skipped by new todos"""
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE todo_archive (id INTEGER PRIMARY KEY, title VARCHAR(100) NOT NULL);
+        INSERT INTO todo_archive (id, title) VALUES (5, 'archived before upgrade');
+    """)
+    conn.close()
+    upgrade_table_schema(str(db_path))
+
+    app = make_app(db_path)
+    with app.app_context():
+        response = app.test_client().post('/todos/', json={'title': 'Fresh'})
+        assert json.loads(response.data)['id'] == 6
+        db.session.remove()
+        db.engine.dispose()
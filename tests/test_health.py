@@ -0,0 +1,77 @@
+import pytest
+from app import create_app, db
+from sqlalchemy import event
+from sqlalchemy.sql import text
+import json
+
+@pytest.fixture
+def app():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'SECRET_KEY': 'test-secret-key',
+        'HEALTH_CHECK_INTERVAL': 60
+    })
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+    app.extensions['health'].stop()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def test_healthz(client):
+    """Test liveness does not depend on the database"""
+    response = client.get('/healthz')
+    assert response.status_code == 200
+    assert json.loads(response.data) == {'status': 'ok'}
+
+def test_readyz(client):
+    """Test readiness reports a healthy database"""
+    response = client.get('/readyz')
+    assert response.status_code == 200
+    assert json.loads(response.data)['status'] == 'ready'
+    assert response.headers.get('Cache-Control') == 'no-store'
+
+def test_readyz_is_cached(app, client):
+    """Test readiness probes never query the database themselves"""
+    client.get('/readyz')
+    statements = []
+
+    def count(*args):
+        statements.append(args)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        for _ in range(20):
+            assert client.get('/readyz').status_code == 200
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    assert statements == []
+
+def test_readyz_reports_schema_mismatch(app, client):
+    """Test readiness fails when the todo table is missing columns"""
+    health = app.extensions['health']
+    health.schema_ok = False
+    db.session.execute(text('DROP TABLE todo'))
+    db.session.execute(text('CREATE TABLE todo (id INTEGER PRIMARY KEY, title VARCHAR(100))'))
+    db.session.commit()
+
+    health.refresh()
+    response = client.get('/readyz')
+    assert response.status_code == 503
+    assert 'completed' in json.loads(response.data)['error']
+
+def test_probes_skip_https_redirect():
+    """Test probes answer over plain HTTP even when HTTPS is forced"""
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'SECRET_KEY': 'test-secret-key'
+    })
+    client = app.test_client()
+    assert client.get('/healthz').status_code == 200
+    assert client.get('/readyz').status_code == 200
+    app.extensions['health'].stop()
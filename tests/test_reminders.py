@@ -0,0 +1,139 @@
+import pytest
+from app import create_app, db
+from app.reminders import ReminderScheduler, parse_window
+from datetime import datetime, timedelta
+from sqlalchemy.sql import text
+import json
+
+@pytest.fixture
+def app():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'WTF_CSRF_CHECK_DEFAULT': False,
+        'SECRET_KEY': 'test-secret-key'
+    })
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def events(app):
+    events = []
+    app.extensions['reminders'] = ReminderScheduler(app, events.append)
+    app.extensions['reminders'].load()
+    return events
+
+def due_in(**kwargs):
+    return (datetime.utcnow() + timedelta(**kwargs)).replace(microsecond=0).isoformat()
+
+def test_parse_window():
+    """Test durations accept an optional unit and reject anything else"""
+    assert parse_window('90') == timedelta(seconds=90)
+    assert parse_window('30m') == timedelta(minutes=30)
+    assert parse_window('2d') == timedelta(days=2)
+    for value in ('', '1y', '-1h', '1000w'):
+        with pytest.raises(ValueError):
+            parse_window(value)
+
+def test_due_endpoint(client):
+    """Test only incomplete todos inside the window are listed, earliest first"""
+    client.post('/todos/', json={'title': 'Soon', 'due_date': due_in(minutes=30)})
+    client.post('/todos/', json={'title': 'Overdue', 'due_date': due_in(hours=-1)})
+    client.post('/todos/', json={'title': 'Later', 'due_date': due_in(hours=3)})
+    client.post('/todos/', json={'title': 'Done', 'due_date': due_in(minutes=10), 'completed': True})
+    client.post('/todos/', json={'title': 'Undated'})
+
+    titles = lambda url: [todo['title'] for todo in json.loads(client.get(url).data)]
+    assert titles('/todos/due') == ['Overdue', 'Soon']
+    assert titles('/todos/due?within=1h&overdue=false') == ['Soon']
+    assert titles('/todos/due?within=4h') == ['Overdue', 'Soon', 'Later']
+    assert client.get('/todos/due?within=soon').status_code == 400
+
+def test_due_query_uses_index(app):
+    """Test the due-soon filter is a range scan on (completed, due_date)"""
+    plan = db.session.execute(text(
+        'EXPLAIN QUERY PLAN SELECT id FROM todo WHERE completed = 0 AND due_date <= :horizon ORDER BY due_date'
+    ), {'horizon': datetime.utcnow()}).fetchall()
+    assert any('ix_todo_completed_due_date' in row[-1] for row in plan)
+
+def test_scheduler_loads_only_the_window(app, client, events):
+    """Test todos due beyond the window are left in the database"""
+    client.post('/todos/', json={'title': 'Soon', 'due_date': due_in(minutes=10)})
+    client.post('/todos/', json={'title': 'Tomorrow', 'due_date': due_in(days=1)})
+    client.post('/todos/', json={'title': 'Overdue', 'due_date': due_in(minutes=-10)})
+
+    scheduler = app.extensions['reminders']
+    assert list(scheduler.pending()) == [1]
+    scheduler.load()
+    assert list(scheduler.pending()) == [1]
+
+def test_scheduler_reacts_to_writes(app, client, events):
+    """Test created, moved, completed and deleted due dates update the schedule"""
+    client.post('/todos/', json={'title': 'Report', 'due_date': due_in(minutes=10)})
+    client.post('/todos/', json={'title': 'Call', 'due_date': due_in(minutes=20)})
+    client.post('/todos/', json={'title': 'Shop', 'due_date': due_in(minutes=30)})
+    client.patch('/todos/2', json={'due_date': due_in(hours=5)})
+    client.patch('/todos/3', json={'completed': True})
+    client.post('/todos/', json={'title': 'Gone', 'due_date': due_in(minutes=5)})
+    client.delete('/todos/4')
+
+    scheduler = app.extensions['reminders']
+    assert list(scheduler.pending()) == [1]
+    assert scheduler.run_once(datetime.utcnow()) == 0
+    assert scheduler.run_once(datetime.utcnow() + timedelta(hours=1)) == 1
+    assert [(event['event'], event['id'], event['title']) for event in events] == [('todo.due', 1, 'Report')]
+
+    # A todo is only reminded about once per due date
+    client.put('/todos/1', json={'title': 'Report v2'})
+    assert scheduler.pending() == {}
+
+def test_scheduler_rechecks_database(app, client, events):
+    """Test a todo changed outside this process is not reminded about"""
+    client.post('/todos/', json={'title': 'Report', 'due_date': due_in(minutes=10)})
+    db.session.execute(text('UPDATE todo SET completed = 1'))
+    db.session.commit()
+
+    assert app.extensions['reminders'].run_once(datetime.utcnow() + timedelta(hours=1)) == 1
+    assert events == []
+
+def test_sink_errors_are_contained(app, client):
+    """Test a failing sink does not stop later reminders"""
+    delivered = []
+
+    def sink(event):
+        if event['id'] == 1:
+            raise RuntimeError('webhook down')
+        delivered.append(event['id'])
+
+    scheduler = app.extensions['reminders'] = ReminderScheduler(app, sink)
+    scheduler.load()
+    client.post('/todos/', json={'title': 'First', 'due_date': due_in(minutes=10)})
+    client.post('/todos/', json={'title': 'Second', 'due_date': due_in(minutes=20)})
+
+    assert scheduler.run_once(datetime.utcnow() + timedelta(hours=1)) == 2
+    assert delivered == [2]
+
+def test_reload_catches_todos_due_between_loads(app, events):
+    """Test a todo written elsewhere that falls due between two loads is still reminded once"""
+    scheduler = app.extensions['reminders']
+    start = datetime.utcnow()
+    scheduler.load(start)
+    db.session.execute(text("INSERT INTO todo (title, completed, due_date, version) VALUES ('Elsewhere', 0, :due, 1)"),
+                       {'due': start + timedelta(seconds=30)})
+    db.session.commit()
+
+    later = start + timedelta(seconds=61)
+    scheduler.load(later)
+    assert scheduler.run_once(later) == 1
+    assert [event['title'] for event in events] == ['Elsewhere']
+
+    scheduler.load(later + timedelta(seconds=61))
+    assert scheduler.run_once(later + timedelta(seconds=61)) == 0
+    assert len(events) == 1
@@ -149,4 +149,55 @@ def test_cors_headers(client):
     response = client.options('/todos/')
     assert response.status_code == 200
     assert response.headers.get('Access-Control-Allow-Origin') == '*'
-    assert response.headers.get('Access-Control-Allow-Methods') is not None 
\ No newline at end of file
+    assert response.headers.get('Access-Control-Allow-Methods') is not None
+
+def test_preflight_skips_flask_routing(app, client):
+    """Test preflight requests are answered by the header middleware"""
+    @app.before_request
+    def fail():
+        raise AssertionError("Preflight entered Flask")
+
+    response = client.options('/todos/123', headers={
+        'Origin': 'https://example.com',
+        'Access-Control-Request-Method': 'DELETE'
+    })
+    assert response.status_code == 200
+    assert 'DELETE' in response.headers.get('Access-Control-Allow-Methods')
+    assert response.headers.get('Access-Control-Max-Age') is not None
+
+def test_headers_set_once(client):
+    """Test each security and CORS header appears exactly once"""
+    response = client.get('/todos/', base_url='https://localhost')
+    for name in ['Access-Control-Allow-Origin', 'X-Frame-Options', 'Content-Security-Policy',
+                 'Strict-Transport-Security']:
+        assert len(response.headers.getlist(name)) == 1
+
+def test_csp_nonce_only_when_used(app, client):
+    """Test a CSP nonce is only added to responses that render one"""
+    from flask import render_template_string
+
+    @app.route('/nonce-page')
+    def nonce_page():
+        return render_template_string('<script nonce="{{ csp_nonce() }}"></script>')
+
+    response = client.get('/todos/')
+    assert 'nonce-' not in response.headers.get('Content-Security-Policy')
+
+    response = client.get('/nonce-page')
+    nonce = response.data.decode().split('"')[1]
+    assert f"'nonce-{nonce}'" in response.headers.get('Content-Security-Policy')
+
+def test_force_https_redirect():
+    """Test plain HTTP is redirected to HTTPS outside of testing"""
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'SECRET_KEY': 'test-secret-key'
+    })
+    client = app.test_client()
+
+    response = client.get('/todos/')
+    assert response.status_code == 302
+    assert response.headers.get('Location').startswith('https://')
+
+    response = client.get('/todos/', headers={'X-Forwarded-Proto': 'https'})
+    assert response.status_code == 200
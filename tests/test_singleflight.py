@@ -0,0 +1,127 @@
+import pytest
+from app import create_app, db
+from app.singleflight import SingleFlight
+import app.routes as routes
+import json
+import threading
+import time
+
+def run_concurrently(count, target):
+    results = [None] * count
+    errors = [None] * count
+
+    def worker(i):
+        try:
+            results[i] = target()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+def test_concurrent_calls_share_one_computation():
+    """Test callers that arrive mid-flight wait for the leader's result"""
+    flight = SingleFlight(timeout=5)
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return 'result'
+
+    threads, results, errors = run_concurrently(8, lambda: flight.do('key', compute))
+    while flight.stats()['coalesced'] < 7:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == ['result'] * 8
+    assert flight.stats()['coalesced'] == 7
+    assert flight.stats()['in_flight'] == 0
+
+def test_errors_propagate_to_waiters():
+    """Test an exception in the leader is raised in every waiting caller"""
+    flight = SingleFlight(timeout=5)
+    release = threading.Event()
+
+    def compute():
+        release.wait(5)
+        raise ValueError('boom')
+
+    threads, results, errors = run_concurrently(4, lambda: flight.do('key', compute))
+    while flight.stats()['coalesced'] < 3:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert all(isinstance(e, ValueError) for e in errors)
+    assert flight.stats()['errors'] == 1
+
+def test_waiters_fall_back_after_timeout():
+    """Test a waiter computes on its own when the leader takes too long"""
+    flight = SingleFlight(timeout=0.05)
+    release = threading.Event()
+
+    threads, results, errors = run_concurrently(1, lambda: flight.do('key', lambda: release.wait(5) and 'slow'))
+    while flight.stats()['in_flight'] == 0:
+        time.sleep(0.001)
+    assert flight.do('key', lambda: 'fast') == 'fast'
+    assert flight.stats()['timeouts'] == 1
+    release.set()
+    threads[0].join()
+
+def test_results_are_not_cached():
+    """Test a finished computation is never reused"""
+    flight = SingleFlight(timeout=5)
+    assert flight.do('key', lambda: 1) == 1
+    assert flight.do('key', lambda: 2) == 2
+
+@pytest.fixture
+def app():
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'WTF_CSRF_CHECK_DEFAULT': False,
+        'SECRET_KEY': 'test-secret-key',
+        'ADMIN_API_KEY': 'test-admin-key'
+    })
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+def test_identical_gets_are_coalesced(app, monkeypatch):
+    """Test concurrent identical list requests run the query once"""
+    release = threading.Event()
+    calls = []
+
+    def slow_list_archived():
+        calls.append(1)
+        release.wait(5)
+        return []
+
+    monkeypatch.setattr(routes, 'list_archived', slow_list_archived)
+    flight = app.extensions['singleflight']
+
+    threads, results, errors = run_concurrently(
+        5, lambda: app.test_client().get('/todos/?include_archived=true'))
+    while flight.stats()['coalesced'] < 4:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert [r.status_code for r in results] == [200] * 5
+    assert all(json.loads(r.data) == [] for r in results)
+    assert all(r.headers.get('X-CSRF-Token') for r in results)
+
+    response = app.test_client().get('/admin/stats', headers={'X-API-KEY': 'test-admin-key'})
+    assert json.loads(response.data)['singleflight']['coalesced'] == 4
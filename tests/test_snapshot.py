@@ -0,0 +1,152 @@
+import pytest
+from app import create_app, db
+from app.models import Todo
+from sqlalchemy import event
+import json
+import sys
+
+def make_app(tmp_path):
+    return create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "todos.db"}',
+        'SNAPSHOT_ENABLED': True,
+        'WTF_CSRF_CHECK_DEFAULT': False,
+        'SECRET_KEY': 'test-secret-key'
+    })
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(tmp_path)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def test_snapshot_serves_list_without_queries(app, client):
+    """Test list and item reads come from the snapshot once a read has rebuilt it"""
+    client.post('/todos/', json={'title': 'First', 'due_date': '2024-01-01T10:00:00'})
+    client.post('/todos/', json={'title': 'Second'})
+    assert not app.extensions['snapshot'].has_snapshot()
+    client.get('/todos/1')
+    assert app.extensions['snapshot'].has_snapshot()
+
+    statements = []
+
+    def count(*args):
+        statements.append(args)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        response = client.get('/todos/')
+        item = client.get('/todos/2')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+
+    assert statements == []
+    data = json.loads(response.data)
+    assert [todo['title'] for todo in data] == ['First', 'Second']
+    assert data[0]['due_date'] == '2024-01-01T10:00:00'
+    assert json.loads(item.data)['title'] == 'Second'
+    assert item.headers.get('ETag') == '"1"'
+
+def test_snapshot_matches_database_path(app, client):
+    """Test the snapshot body is identical in content to a freshly queried list"""
+    client.post('/todos/', json={'title': 'First', 'description': 'Desc'})
+    client.patch('/todos/1', json={'completed': True})
+    from_snapshot = json.loads(client.get('/todos/').data)
+
+    app.extensions['snapshot'].invalidate()
+    app.extensions.pop('snapshot')
+    from_database = json.loads(client.get('/todos/').data)
+    assert from_snapshot == from_database
+
+def test_snapshot_shared_between_workers(tmp_path, app, client):
+    """Test a write through one app is visible to another app on the same database"""
+    other = make_app(tmp_path).test_client()
+    assert json.loads(other.get('/todos/').data) == []
+
+    client.post('/todos/', json={'title': 'Shared'})
+    assert [todo['title'] for todo in json.loads(other.get('/todos/').data)] == ['Shared']
+
+    client.delete('/todos/1')
+    assert json.loads(other.get('/todos/').data) == []
+    assert other.get('/todos/1').status_code == 404
+
+def test_direct_writes_invalidate_snapshot(app, client):
+    """Test commits outside the API never leave a stale snapshot behind"""
+    client.post('/todos/', json={'title': 'Original'})
+    assert client.get('/todos/').status_code == 200
+
+    todo = db.session.get(Todo, 1)
+    todo.title = 'Changed'
+    db.session.commit()
+    assert not app.extensions['snapshot'].has_snapshot()
+
+    assert json.loads(client.get('/todos/').data)[0]['title'] == 'Changed'
+
+def test_api_writes_only_invalidate(app, client, monkeypatch):
+    """Test writes drop the snapshot and leave the rebuild to the next read"""
+    client.post('/todos/', json={'title': 'First'})
+    snapshot = app.extensions['snapshot']
+    calls = []
+    for name in ('invalidate', 'publish'):
+        original = getattr(snapshot, name)
+        monkeypatch.setattr(snapshot, name, lambda *args, _name=name, _original=original, **kwargs:
+                            calls.append(_name) or _original(*args, **kwargs))
+
+    client.post('/todos/', json={'title': 'Second', 'tags': ['home']})
+    client.patch('/todos/1', json={'completed': True})
+    client.delete('/todos/2')
+    assert calls == ['invalidate', 'invalidate', 'invalidate']
+
+    client.get('/todos/')
+    client.get('/todos/1')
+    assert calls[3:] == ['publish']
+
+def test_failed_invalidate_keeps_committed_write(app, client, monkeypatch):
+    """Test a snapshot error after commit is logged instead of failing the write"""
+    client.post('/todos/', json={'title': 'First'})
+    snapshot = app.extensions['snapshot']
+
+    def fail(*args, **kwargs):
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(snapshot, 'invalidate', fail)
+    response = client.post('/todos/', json={'title': 'Second'})
+    assert response.status_code == 201
+
+    monkeypatch.undo()
+    snapshot.invalidate()
+    assert [todo['title'] for todo in json.loads(client.get('/todos/').data)] == ['First', 'Second']
+
+def test_failed_rebuild_reads_from_database(app, client, monkeypatch):
+    """Test reads fall back to the database when the snapshot cannot be rebuilt"""
+    client.post('/todos/', json={'title': 'First'})
+    snapshot = app.extensions['snapshot']
+    snapshot.invalidate()
+
+    def fail(*args, **kwargs):
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(snapshot, 'publish', fail)
+    response = client.get('/todos/')
+    assert response.status_code == 200
+    assert [todo['title'] for todo in json.loads(response.data)] == ['First']
+    item = client.get('/todos/1')
+    assert item.status_code == 200
+    assert json.loads(item.data)['title'] == 'First'
+    assert not snapshot.has_snapshot()
+
+def test_snapshot_disabled_by_default(tmp_path, monkeypatch):
+    """Test the snapshot is opt-in and its module is not imported unless enabled"""
+    monkeypatch.delitem(sys.modules, 'app.snapshot', raising=False)
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "todos.db"}',
+    })
+    assert 'snapshot' not in app.extensions
+    assert 'app.snapshot' not in sys.modules
@@ -1,6 +1,7 @@
 import pytest
 from app import create_app, db
 from app.models import Todo
+from sqlalchemy import event
 import json
 from datetime import datetime
 
@@ -134,4 +135,125 @@ def test_delete_todo(client, init_database, csrf_token):
 
     # Verify the todo was deleted
     response = client.get(f'/todos/{todo.id}')
-    assert response.status_code == 404 
\ No newline at end of file
+    assert response.status_code == 404
+
+def test_patch_todo(client, init_database, csrf_token):
+    """Test partially updating a todo bumps its version"""
+    todo = Todo.from_dict({
+        'title': 'Test Todo',
+        'description': 'Test Description',
+        'completed': False
+    })
+    init_database.session.add(todo)
+    init_database.session.commit()
+
+    response = client.patch(f'/todos/{todo.id}', json={'completed': True},
+        headers={'X-CSRF-Token': csrf_token}
+    )
+    assert response.status_code == 200
+    assert response.headers.get('ETag') == '"2"'
+    data = json.loads(response.data)
+    assert data['title'] == 'Test Todo'
+    assert data['completed'] is True
+    assert data['version'] == 2
+
+def test_patch_missing_todo(client, init_database, csrf_token):
+    """Test patching a non-existent todo returns 404"""
+    response = client.patch('/todos/999', json={'title': 'Nope'},
+        headers={'X-CSRF-Token': csrf_token}
+    )
+    assert response.status_code == 404
+
+def test_if_match_conflict(client, init_database, csrf_token):
+    """Test optimistic concurrency with If-Match"""
+    todo = Todo.from_dict({'title': 'Test Todo'})
+    init_database.session.add(todo)
+    init_database.session.commit()
+
+    response = client.get(f'/todos/{todo.id}')
+    etag = response.headers.get('ETag')
+    assert etag == '"1"'
+
+    response = client.patch(f'/todos/{todo.id}', json={'title': 'First'}, headers={'If-Match': etag, 'X-CSRF-Token': csrf_token})
+    assert response.status_code == 200
+
+    # A second writer holding the old ETag must not clobber the first update
+    response = client.patch(f'/todos/{todo.id}', json={'title': 'Second'}, headers={'If-Match': etag, 'X-CSRF-Token': csrf_token})
+    assert response.status_code == 412
+
+    response = client.delete(f'/todos/{todo.id}', headers={'If-Match': etag, 'X-CSRF-Token': csrf_token})
+    assert response.status_code == 412
+
+    response = client.delete(f'/todos/{todo.id}', headers={'If-Match': '"2"', 'X-CSRF-Token': csrf_token})
+    assert response.status_code == 204
+
+def test_tags_and_tag_filter(client, init_database, csrf_token):
+    """Test creating tagged todos and listing them by tag"""
+    headers = {'X-CSRF-Token': csrf_token}
+    response = client.post('/todos/', json={'title': 'Groceries', 'tags': ['home', 'errand']}, headers=headers)
+    assert response.status_code == 201
+    assert json.loads(response.data)['tags'] == ['errand', 'home']
+    client.post('/todos/', json={'title': 'Report', 'tags': ['work']}, headers=headers)
+
+    response = client.get('/todos/?tag=home')
+    assert [todo['title'] for todo in json.loads(response.data)] == ['Groceries']
+
+    response = client.patch('/todos/2', json={'tags': ['work', 'home']}, headers=headers)
+    assert json.loads(response.data)['tags'] == ['home', 'work']
+    response = client.get('/todos/?tag=home')
+    assert [todo['title'] for todo in json.loads(response.data)] == ['Groceries', 'Report']
+
+def test_subtasks(client, init_database, csrf_token):
+    """Test subtasks are linked to and listed under their parent"""
+    headers = {'X-CSRF-Token': csrf_token}
+    client.post('/todos/', json={'title': 'Move house'}, headers=headers)
+    response = client.post('/todos/', json={'title': 'Pack books', 'parent_id': 1}, headers=headers)
+    assert json.loads(response.data)['parent_id'] == 1
+
+    data = json.loads(client.get('/todos/1').data)
+    assert data['subtasks'] == [{'id': 2, 'title': 'Pack books', 'completed': False}]
+
+    # A todo cannot become a subtask of its own subtask or of a missing todo
+    response = client.patch('/todos/1', json={'parent_id': 2}, headers=headers)
+    assert response.status_code == 400
+    response = client.post('/todos/', json={'title': 'Orphan', 'parent_id': 999}, headers=headers)
+    assert response.status_code == 400
+
+    # Deleting the parent detaches its subtasks
+    client.delete('/todos/1', headers=headers)
+    assert json.loads(client.get('/todos/2').data)['parent_id'] is None
+
+def test_list_query_count_is_constant(client, init_database, csrf_token):
+    """Test listing loads tags and subtasks in batches rather than per row"""
+    def add_todos(count):
+        for i in range(count):
+            client.post('/todos/', json={'title': f'Parent {i}', 'tags': ['a', f'tag {i}']},
+                headers={'X-CSRF-Token': csrf_token})
+            parent_id = json.loads(client.get('/todos/').data)[-1]['id']
+            client.post('/todos/', json={'title': f'Child {i}', 'parent_id': parent_id, 'tags': ['b']},
+                headers={'X-CSRF-Token': csrf_token})
+        init_database.session.expunge_all()
+
+    def count_list_queries():
+        statements = []
+
+        def count_statement(conn, cursor, statement, *args):
+            if statement.lstrip().upper().startswith('SELECT'):
+                statements.append(statement)
+
+        event.listen(init_database.engine, 'before_cursor_execute', count_statement)
+        try:
+            response = client.get('/todos/')
+        finally:
+            event.remove(init_database.engine, 'before_cursor_execute', count_statement)
+        init_database.session.expunge_all()
+        return len(json.loads(response.data)), len(statements)
+
+    add_todos(2)
+    small_size, small_queries = count_list_queries()
+    add_todos(18)
+    large_size, large_queries = count_list_queries()
+
+    assert (small_size, large_size) == (4, 40)
+    assert small_queries == large_queries
+    assert large_queries <= 4
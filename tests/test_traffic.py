@@ -0,0 +1,87 @@
+import pytest
+from app import create_app, db
+from app.traffic import body_shape, endpoint_key, latency_report, load_trace, replay, replay_command
+import json
+
+@pytest.fixture
+def capture_path(tmp_path):
+    return tmp_path / 'capture.ndjson'
+
+@pytest.fixture
+def app(capture_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'WTF_CSRF_CHECK_DEFAULT': False,
+        'SECRET_KEY': 'test-secret-key',
+        'TRAFFIC_CAPTURE_PATH': str(capture_path)
+    })
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def test_body_shape_drops_values():
+    """Test only the structure and value kinds of a body are kept"""
+    shape = body_shape({'title': 'Secret', 'completed': True, 'parent_id': 3,
+                        'due_date': '2024-01-01T10:00:00', 'tags': ['home', 'work'], 'description': None})
+    assert shape == {'title': 'str', 'completed': 'bool', 'parent_id': 'num',
+                     'due_date': 'datetime', 'tags': ['str'], 'description': 'null'}
+
+def test_endpoint_key_groups_ids():
+    """Test ids in paths collapse into one endpoint"""
+    assert endpoint_key('GET', '/todos/12') == 'GET /todos/<id>'
+    assert endpoint_key('GET', '/todos/') == 'GET /todos/'
+
+def test_capture_records_sanitized_requests(client, capture_path):
+    """Test each request is written as one line without user content"""
+    client.post('/todos/', json={'title': 'Private title', 'tags': ['secret-tag']})
+    client.get('/todos/?tag=secret-tag&include_archived=true')
+    client.get('/healthz')
+
+    raw = capture_path.read_text()
+    assert 'Private' not in raw and 'secret-tag' not in raw
+    records = load_trace(capture_path)
+    assert [(r['m'], r['p'], r['s']) for r in records] == [('POST', '/todos/', 201), ('GET', '/todos/', 200)]
+    assert records[0]['b'] == {'title': 'str', 'tags': ['str']}
+    assert records[1]['q'] == {'tag': '*', 'include_archived': 'true'}
+    assert all(r['d'] >= 0 for r in records)
+
+def test_replay_reports_latency_by_endpoint(app, client, capture_path):
+    """Test a captured trace replays against another app with per-endpoint stats"""
+    client.post('/todos/', json={'title': 'One'})
+    client.get('/todos/1')
+    client.patch('/todos/1', json={'completed': True})
+    client.get('/todos/')
+
+    target = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'WTF_CSRF_ENABLED': False,
+        'SECRET_KEY': 'test-secret-key'
+    })
+    results = replay(target, load_trace(capture_path), speed=0, concurrency=1)
+    report = latency_report(results)
+
+    assert set(report) == {'POST /todos/', 'GET /todos/<id>', 'PATCH /todos/<id>', 'GET /todos/'}
+    assert all(row['count'] == 1 and row['non_2xx'] == 0 for row in report.values())
+    assert all(row['p50_ms'] <= row['p99_ms'] <= row['max_ms'] for row in report.values())
+
+def test_replay_command(app, client, capture_path):
+    """Test the CLI replays into a fresh database seeded for the ids in the trace"""
+    client.post('/todos/', json={'title': 'One'})
+    client.post('/todos/', json={'title': 'Two'})
+    client.get('/todos/2')
+    client.delete('/todos/1')
+
+    result = app.test_cli_runner().invoke(replay_command, [str(capture_path), '--speed', '0', '--json-report'])
+    assert result.exit_code == 0, result.output
+    report = json.loads(result.output)
+    assert report['POST /todos/']['count'] == 2
+    assert report['GET /todos/<id>']['non_2xx'] == 0
+    assert report['DELETE /todos/<id>']['non_2xx'] == 0